@@ -1,55 +1,163 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator
+from typing import Any, Literal
 
-from typing import Any
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
 
-from fastapi import APIRouter, File, UploadFile
-
-from app.models.schemas import OCRResponse, OrderItem
+from app.api.uploads import MAX_FILE_SIZE, read_capped
+from app.config import settings
+from app.models.schemas import BatchReceiptResult, JobStatus, OCRResponse, OrderItem, Routing
+from app.services.cascade import CASCADE_ROUTES, images_to_escalate, merge_vlm, score_image, score_receipt
+from app.services.job_queue import Job, QueueFullError, job_queue
+from app.services.metrics import IN_FLIGHT, OCR_FAILURES, STAGE_SECONDS
+from app.services.ocr_cache import image_key, ocr_cache
+from app.services.ocr_pool import run_in_pool
+from app.services.ocr_result import OCRResult
 from app.services.ocr_service import extract_text_with_metadata
 from app.services.receipt_parser import parse_mcd_app_receipt
+from app.services.screenshot_dedup import ScreenshotPlan, plan_screenshots
+from app.services.vlm_service import extract_receipt_data, run_in_vlm_executor
 
 router = APIRouter(prefix="/api", tags=["OCR"])
 
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_FILES_PER_REQUEST = 10
+MAX_BATCH_FILES = 40  # across all receipts of a batch; each receipt still <= MAX_FILES_PER_REQUEST
+MAX_REQUEST_SIZE = 40 * 1024 * 1024  # 40MB of image data across all files
 
+# (filename, image bytes or None, validation error or None)
+Upload = tuple[str | None, bytes | None, str | None]
 
-@router.post("/ocr", response_model=OCRResponse)
-async def process_receipt(files: list[UploadFile] = File(...)) -> OCRResponse:
-    """Accept multiple receipt images, run OCR on each, parse as one receipt."""
-    all_ocr_results: list[list[dict[str, Any]]] = []
+ExtractionMode = Literal["ocr", "cascade"]
+
+
+async def _read_uploads(files: list[UploadFile], max_files: int = MAX_FILES_PER_REQUEST) -> list[Upload]:
+    """Read and validate all uploads of one request against the per-file,
+    per-request byte and file-count limits."""
+    if len(files) > max_files:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many files: {len(files)} (max {max_files})",
+        )
+
+    uploads: list[Upload] = []
+    remaining = MAX_REQUEST_SIZE
+    for file in files:
+        # Validate content type
+        if file.content_type and not file.content_type.startswith("image/"):
+            uploads.append((file.filename, None, f"File {file.filename} is not an image: {file.content_type}"))
+            continue
+
+        # Read and validate size
+        with STAGE_SECONDS.time(stage="upload_read"):
+            contents = await read_capped(file, min(MAX_FILE_SIZE, remaining))
+        if contents is None:
+            if remaining < MAX_FILE_SIZE:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Uploads exceed {MAX_REQUEST_SIZE} bytes in total",
+                )
+            uploads.append((file.filename, None, f"File {file.filename} too large: over {MAX_FILE_SIZE} bytes"))
+            continue
+
+        remaining -= len(contents)
+        uploads.append((file.filename, contents, None))
+    return uploads
+
+
+async def _ocr_image(filename: str | None, contents: bytes, top: int = 0) -> tuple[OCRResult | None, str | None]:
+    """OCR one image (from row `top` down) on the worker pool.
+
+    Returns (ocr_data, None) on success or (None, error message) on failure.
+    """
+    try:
+        # Re-uploads of the same screenshot skip OCR entirely
+        key = image_key(contents, top)
+        ocr_data = await asyncio.to_thread(ocr_cache.get, key)
+        if ocr_data is None:
+            # Extract OCR with metadata off the event loop (default engine)
+            with IN_FLIGHT.track(kind="ocr_image"):
+                ocr_data = await run_in_pool(extract_text_with_metadata, contents, None, top)
+            _observe_ocr_stages(ocr_data.preprocess)
+            await asyncio.to_thread(ocr_cache.put, key, ocr_data)
+        return ocr_data, None
+
+    except Exception as e:
+        OCR_FAILURES.inc()
+        return None, f"OCR failed for {filename}: {str(e)}"
+
+
+def _observe_ocr_stages(stats: dict[str, Any]) -> None:
+    """Record stage timings measured inside the OCR worker (which may be
+    another process, so they travel back with the result)."""
+    for stage, key in (
+        ("image_decode", "decode_ms"),
+        ("image_resize", "resize_ms"),
+        ("ocr_detection", "det_ms"),
+        ("ocr_classification", "cls_ms"),
+        ("ocr_recognition", "rec_ms"),
+    ):
+        STAGE_SECONDS.observe(stats[key] / 1000, stage=stage)
+
+
+async def _process_uploads(uploads: list[Upload], mode: ExtractionMode = "ocr") -> OCRResponse:
+    """OCR every accepted image in parallel and parse them as ONE receipt.
+
+    In "cascade" mode a low-scoring result is escalated to the VLM.
+    Duplicate screenshots are skipped and overlapping ones OCR'd only
+    below the band already seen (see `plan_screenshots`).
+    """
+    started = time.perf_counter()
+    all_ocr_results: list[OCRResult] = []
+    # Per OCR result: cropped at pixel level right below the previous result
+    aligned: list[bool] = []
     all_errors = []
     all_raw_text = []
 
-    # Process each file sequentially
-    for file in files:
-        try:
-            # Validate content type
-            if file.content_type and not file.content_type.startswith("image/"):
-                all_errors.append(f"File {file.filename} is not an image: {file.content_type}")
-                continue
-
-            # Read and validate size
-            contents = await file.read()
-            if len(contents) > MAX_FILE_SIZE:
-                all_errors.append(f"File {file.filename} too large: {len(contents)} bytes")
-                continue
-
-            # Extract OCR with metadata
-            ocr_data = extract_text_with_metadata(contents)
-            all_ocr_results.append(ocr_data['ocr_results'])
-            all_raw_text.extend(ocr_data['full_text'].split('\n'))
+    plans = await _plan_uploads(uploads)
 
-        except Exception as e:
-            all_errors.append(f"OCR failed for {file.filename}: {str(e)}")
+    async def run(upload: Upload, plan: ScreenshotPlan) -> tuple[OCRResult | None, str | None]:
+        filename, contents, error = upload
+        if contents is None:
+            return None, error
+        return await _ocr_image(filename, contents, plan.top)
+
+    # gather keeps upload order, which the screenshot merge relies on
+    kept = [(upload, plan) for upload, plan in zip(uploads, plans) if plan.duplicate_of is None]
+    outcomes = await asyncio.gather(*(run(upload, plan) for upload, plan in kept))
+    # (image bytes, its OCR results or None if OCR failed) for every accepted image
+    images: list[tuple[bytes, OCRResult | None]] = []
+    previous_ok = False
+    for ((_, contents, _), plan), (ocr_data, error) in zip(kept, outcomes):
+        if contents is not None:
+            images.append((contents, ocr_data))
+        if error:
+            all_errors.append(error)
+            # Rejected uploads were never planned; a failed OCR breaks the chain
+            previous_ok = previous_ok and contents is None
+            continue
+        # The crop was registered against the previous kept image; if that
+        # one failed, the text merge aligns this image with an earlier one
+        aligned.append(plan.top > 0 and previous_ok)
+        previous_ok = True
+        all_ocr_results.append(ocr_data)
+        all_raw_text.extend(ocr_data.texts)
 
     # Parse combined OCR results as ONE receipt
-    parsed = parse_mcd_app_receipt(all_ocr_results)
-    
+    parsed = parse_mcd_app_receipt(all_ocr_results, aligned)
+
     # Merge errors
     if parsed.get("errors"):
         parsed["errors"].extend(all_errors)
     else:
         parsed["errors"] = all_errors
 
+    routing = None
+    if mode == "cascade":
+        ocr_ms = (time.perf_counter() - started) * 1000
+        parsed, routing = await _cascade(parsed, images, all_raw_text, ocr_ms)
+
     return OCRResponse(
         order_number=parsed.get("order_number", ""),
         restaurant=parsed.get("restaurant", ""),
@@ -59,4 +167,165 @@ async def process_receipt(files: list[UploadFile] = File(...)) -> OCRResponse:
         is_valid=parsed.get("is_valid", False),
         errors=parsed.get("errors", []),
         raw_text=all_raw_text,
+        routing=routing,
+    )
+
+
+async def _plan_uploads(uploads: list[Upload]) -> list[ScreenshotPlan]:
+    """One plan per upload; only the accepted images of a multi-image receipt are planned."""
+    plans = [ScreenshotPlan() for _ in uploads]
+    accepted = [i for i, (_, contents, _) in enumerate(uploads) if contents is not None]
+    if not settings.ocr_screenshot_dedup or len(accepted) < 2:
+        return plans
+    with STAGE_SECONDS.time(stage="screenshot_dedup"):
+        planned = await asyncio.to_thread(plan_screenshots, [uploads[i][1] for i in accepted])
+    for i, plan in zip(accepted, planned):
+        if plan.duplicate_of is not None:
+            plan.duplicate_of = accepted[plan.duplicate_of]
+        plans[i] = plan
+    return plans
+
+
+async def _cascade(
+    parsed: dict[str, Any],
+    images: list[tuple[bytes, OCRResult | None]],
+    raw_text: list[str],
+    ocr_ms: float,
+) -> tuple[dict[str, Any], Routing]:
+    """Score the OCR parse and run the VLM on the images that need it."""
+    image_scores = []
+    reasons = []
+    for i, (_, ocr_results) in enumerate(images):
+        image_score, image_reasons = score_image(ocr_results)
+        image_scores.append(image_score)
+        reasons.extend(f"image {i}: {r}" for r in image_reasons)
+    score, receipt_reasons = score_receipt(parsed, image_scores)
+    reasons.extend(receipt_reasons)
+
+    escalate = images_to_escalate(score, image_scores)
+    if not escalate:
+        CASCADE_ROUTES.inc(route="ocr")
+        return parsed, Routing(
+            engine="ocr", score=round(score, 3), reasons=reasons, escalated_images=[], ocr_ms=round(ocr_ms, 1)
+        )
+
+    CASCADE_ROUTES.inc(route="vlm")
+    started = time.perf_counter()
+    with STAGE_SECONDS.time(stage="cascade_escalation"):
+        # The VLM pool queues these fairly; each call holds one model instance
+        vlm_results = await asyncio.gather(
+            *(run_in_vlm_executor(extract_receipt_data, images[i][0]) for i in escalate)
+        )
+    vlm_ms = (time.perf_counter() - started) * 1000
+    return merge_vlm(parsed, vlm_results, raw_text), Routing(
+        engine="ocr+vlm",
+        score=round(score, 3),
+        reasons=reasons,
+        escalated_images=escalate,
+        ocr_ms=round(ocr_ms, 1),
+        vlm_ms=round(vlm_ms, 1),
+    )
+
+
+@router.post("/ocr", response_model=OCRResponse)
+async def process_receipt(
+    files: list[UploadFile] = File(...),
+    mode: ExtractionMode | None = None,
+) -> OCRResponse:
+    """Accept multiple receipt images, run OCR on each, parse as one receipt.
+
+    `mode=cascade` escalates low-confidence receipts to the VLM and reports
+    the decision in `routing`; defaults to EXTRACTION_MODE.
+    """
+    uploads = await _read_uploads(files)
+    return await _process_uploads(uploads, mode or settings.extraction_mode)
+
+
+async def _batch_results(receipts: dict[int, list[Upload]], mode: ExtractionMode) -> AsyncIterator[str]:
+    """Process all receipts concurrently, yielding one NDJSON line per
+    receipt in completion order."""
+
+    async def run(receipt: int, uploads: list[Upload]) -> BatchReceiptResult:
+        try:
+            return BatchReceiptResult(receipt=receipt, result=await _process_uploads(uploads, mode))
+        except Exception as e:
+            return BatchReceiptResult(receipt=receipt, error=f"Receipt {receipt} failed: {str(e)}")
+
+    # Every receipt's images go to the OCR pool at once, so the batch
+    # takes about as long as its slowest receipt, not the sum of them
+    tasks = [asyncio.create_task(run(receipt, uploads)) for receipt, uploads in receipts.items()]
+    try:
+        with IN_FLIGHT.track(kind="ocr_batch"):
+            for next_done in asyncio.as_completed(tasks):
+                yield (await next_done).model_dump_json() + "\n"
+    finally:
+        # Client went away: stop receipts that have not finished
+        for task in tasks:
+            task.cancel()
+
+
+@router.post("/ocr/batch")
+async def process_receipt_batch(
+    files: list[UploadFile] = File(...),
+    groups: list[int] | None = Form(None),
+    mode: ExtractionMode | None = None,
+) -> StreamingResponse:
+    """Accept several receipts in one request and stream each result as NDJSON.
+
+    `groups` gives the receipt number of every file, in upload order; files
+    sharing a number are screenshots of the same receipt. Without it each
+    file is its own receipt. Each line is a `BatchReceiptResult`, sent as
+    soon as that receipt is parsed.
+    """
+    if groups is None:
+        groups = list(range(len(files)))
+    elif len(groups) != len(files):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Got {len(groups)} groups for {len(files)} files; give one receipt number per file",
+        )
+
+    uploads = await _read_uploads(files, max_files=MAX_BATCH_FILES)
+    receipts: dict[int, list[Upload]] = {}
+    for receipt, upload in zip(groups, uploads):
+        receipts.setdefault(receipt, []).append(upload)
+    for receipt, pages in receipts.items():
+        if len(pages) > MAX_FILES_PER_REQUEST:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Too many files for receipt {receipt}: {len(pages)} (max {MAX_FILES_PER_REQUEST})",
+            )
+
+    return StreamingResponse(
+        _batch_results(receipts, mode or settings.extraction_mode),
+        media_type="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no"},
     )
+
+
+def _job_status(job: Job) -> JobStatus:
+    return JobStatus(job_id=job.id, status=job.status, result=job.result, error=job.error)
+
+
+@router.post("/ocr/jobs", response_model=JobStatus, status_code=202)
+async def submit_receipt_job(
+    files: list[UploadFile] = File(...),
+    mode: ExtractionMode | None = None,
+) -> JobStatus:
+    """Queue a receipt for processing and return its job id immediately."""
+    # Uploads are closed once the request ends, so read them up front
+    uploads = await _read_uploads(files)
+    try:
+        job = job_queue.submit(lambda: _process_uploads(uploads, mode or settings.extraction_mode))
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return _job_status(job)
+
+
+@router.get("/ocr/jobs/{job_id}", response_model=JobStatus)
+async def get_receipt_job(job_id: str) -> JobStatus:
+    """Poll a queued receipt job; `result` is set once status is 'done'."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job {job_id}")
+    return _job_status(job)
@@ -0,0 +1,25 @@
+from fastapi import UploadFile
+
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+
+async def read_capped(file: UploadFile, limit: int = MAX_FILE_SIZE) -> bytes | None:
+    """Read an upload in chunks, giving up as soon as it exceeds `limit`.
+
+    Returns None when the file is too large. Starlette has already spooled
+    the whole part to a temp file by now, so this only bounds what is read
+    into memory (and a known size is rejected without reading); ingress is
+    bounded by BodySizeLimitMiddleware.
+    """
+    if file.size is not None and file.size > limit:
+        return None
+    chunks: list[bytes] = []
+    total = 0
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        total += len(chunk)
+        if total > limit:
+            return None
+        chunks.append(chunk)
+    # One copy into a single buffer; the decoder reads it through BytesIO
+    return b"".join(chunks)
@@ -0,0 +1,75 @@
+import asyncio
+import json
+import threading
+from collections.abc import AsyncIterator
+from typing import Any
+
+from fastapi import APIRouter, File, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+
+from app.api.uploads import MAX_FILE_SIZE, read_capped
+from app.services.metrics import IN_FLIGHT
+from app.services.vlm_service import run_in_vlm_executor, stream_receipt_data
+
+router = APIRouter(prefix="/api", tags=["VLM"])
+
+
+def _sse(event: str, data: dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _receipt_events(image_bytes: bytes) -> AsyncIterator[str]:
+    """Relay `stream_receipt_data` from a worker thread as SSE messages.
+
+    When the client disconnects Starlette stops iterating; the `finally`
+    then sets the cancel event so the worker abandons its queue slot or
+    stops generating at the next token.
+    """
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue[tuple[str, dict[str, Any]] | None] = asyncio.Queue()
+    cancel = threading.Event()
+
+    def publish(item: tuple[str, dict[str, Any]] | None) -> None:
+        try:
+            loop.call_soon_threadsafe(events.put_nowait, item)
+        except RuntimeError:
+            cancel.set()  # event loop already closed
+
+    def produce() -> None:
+        try:
+            for item in stream_receipt_data(image_bytes, cancel=cancel):
+                publish(item)
+        finally:
+            publish(None)
+
+    worker = asyncio.ensure_future(run_in_vlm_executor(produce))
+    try:
+        with IN_FLIGHT.track(kind="vlm_stream"):
+            while (item := await events.get()) is not None:
+                yield _sse(*item)
+    finally:
+        cancel.set()
+        if worker.done():
+            worker.result()
+
+
+@router.post("/vlm/stream")
+async def stream_receipt(file: UploadFile = File(...)) -> StreamingResponse:
+    """Extract one receipt with the VLM, streaming progress as Server-Sent Events.
+
+    Events: `status`, `token` (generated text), `field` / `item` (parsed as
+    soon as complete), then `result` or `error`. Close the connection to
+    cancel generation.
+    """
+    if file.content_type and not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail=f"File {file.filename} is not an image: {file.content_type}")
+    contents = await read_capped(file)
+    if contents is None:
+        raise HTTPException(status_code=413, detail=f"File {file.filename} too large: over {MAX_FILE_SIZE} bytes")
+
+    return StreamingResponse(
+        _receipt_events(contents),
+        media_type="text/event-stream",
+        # Proxies must not buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,214 @@
+"""Runtime settings, read once from environment variables at import time."""
+
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+# Menu catalog shipped with the app, used for item names and prices
+_BUNDLED_MENU = str(Path(__file__).resolve().parent / "data" / "mcd_menu.json")
+
+
+def _env_str(name: str, default: str) -> str:
+    return os.environ.get(name, default).strip()
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    return int(value)
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    return float(value)
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _load_tuning(path: str) -> dict:
+    """Host-tuned OCR defaults written by benchmarks/autotune_ocr.py, if present.
+
+    They replace the built-in defaults; environment variables still win.
+    """
+    if not path:
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f).get("settings", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def _default_ocr_workers() -> int:
+    # RapidOCR already uses several ONNX threads per call, so a handful of
+    # concurrent calls is enough to keep a small CPU box busy.
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+@dataclass(frozen=True)
+class Settings:
+    # OCR worker pool: "thread" shares one engine, "process" gives each worker its own
+    ocr_executor: str = "thread"
+    ocr_workers: int = 1
+
+    # Image normalization before OCR (0 disables a cap); boxes are mapped back.
+    # Phone screenshots (up to 2796px) stay full size: small badge text is lost below
+    ocr_max_long_edge: int = 2800
+    ocr_max_pixels: int = 0
+    ocr_grayscale: bool = False
+
+    # Tall screenshots are OCR'd as overlapping horizontal strips (0 disables)
+    ocr_tile_height: int = 1600
+    ocr_tile_overlap: int = 200
+    ocr_tile_min_aspect: float = 3.0
+    ocr_tile_workers: int = 2
+
+    # Recognition results of recurring text-line crops (LFU entries, 0 disables)
+    ocr_rec_cache_entries: int = 2048
+
+    # ONNX Runtime sessions of the OCR engine (0 threads: let ORT decide).
+    # With a process pool, keep workers x intra-op threads within the core count
+    ocr_intra_op_threads: int = 0
+    ocr_inter_op_threads: int = 0
+    ocr_graph_optimization: str = "all"  # disable | basic | extended | all
+    ocr_execution_mode: str = "sequential"  # or "parallel" (uses the inter-op threads)
+    ocr_mem_arena: bool = False
+    # Alternative det / rec / cls ONNX models ("" keeps RapidOCR's bundled ones);
+    # a converted rec model without embedded characters needs its keys file
+    ocr_det_model: str = ""
+    ocr_rec_model: str = ""
+    ocr_cls_model: str = ""
+    ocr_rec_keys: str = ""
+    # "int8" swaps in quantized det / rec models from ocr_int8_model_dir
+    ocr_model_profile: str = "fp32"
+    ocr_int8_model_dir: str = "models/ocr-int8"
+    # Written by the autotune command; supplies defaults for the settings above
+    ocr_tuning_file: str = ".cache/ocr_tuning.json"
+
+    # Multi-screenshot uploads: drop duplicates and crop already-seen bands before OCR
+    ocr_screenshot_dedup: bool = True
+
+    # OCR result cache: in-memory LRU in front of an on-disk store ("" disables disk)
+    ocr_cache_entries: int = 256
+    ocr_cache_ttl_seconds: int = 24 * 60 * 60
+    ocr_cache_dir: str = ".cache/ocr"
+    ocr_cache_disk_mb: int = 512
+
+    # VLM: N llama.cpp contexts over one mmapped GGUF, each with its own threads
+    vlm_model_path: str = "models/SmolVLM2-2.2B-Instruct-Q4_K_M.gguf"
+    vlm_mmproj_path: str = "models/mmproj-SmolVLM2-2.2B-Instruct-Q8_0.gguf"
+    vlm_pool_size: int = 1
+    vlm_threads: int = 1
+    vlm_queue_timeout_seconds: float = 60.0
+    # VLM input: crop to the receipt, fit the encoder's square input (0 keeps size)
+    vlm_crop: bool = True
+    vlm_image_size: int = 384
+    vlm_jpeg_quality: int = 90
+
+    # /api/ocr extraction: "ocr" only, or "cascade" (OCR first, VLM for low-scoring receipts)
+    extraction_mode: str = "ocr"
+    cascade_min_score: float = 0.75
+    cascade_scope: str = "request"  # escalate the whole "request" or only weak "image"s
+
+    # Menu catalog for item names, and prices where it lists them ("" disables)
+    menu_catalog_path: str = _BUNDLED_MENU
+
+    # Asynchronous job API: concurrent jobs, backlog bound, result retention
+    job_workers: int = 1
+    job_queue_size: int = 100
+    job_result_ttl_seconds: int = 10 * 60
+
+    # Engines to load and exercise at startup before /ready reports ready
+    warmup_engines: tuple[str, ...] = ("ocr",)
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        executor = _env_str("OCR_EXECUTOR", "thread").lower()
+        if executor not in ("thread", "process"):
+            raise ValueError(f"OCR_EXECUTOR must be 'thread' or 'process', got {executor!r}")
+        tuning_file = _env_str("OCR_TUNING_FILE", cls.ocr_tuning_file)
+        tuned = _load_tuning(tuning_file)
+        ocr_workers = max(1, _env_int("OCR_WORKERS", tuned.get("ocr_workers", _default_ocr_workers())))
+        graph_optimization = _env_str(
+            "OCR_GRAPH_OPTIMIZATION", tuned.get("ocr_graph_optimization", "all")
+        ).lower()
+        if graph_optimization not in ("disable", "basic", "extended", "all"):
+            raise ValueError(
+                f"OCR_GRAPH_OPTIMIZATION must be disable, basic, extended or all, got {graph_optimization!r}"
+            )
+        execution_mode = _env_str("OCR_EXECUTION_MODE", tuned.get("ocr_execution_mode", "sequential")).lower()
+        if execution_mode not in ("sequential", "parallel"):
+            raise ValueError(f"OCR_EXECUTION_MODE must be 'sequential' or 'parallel', got {execution_mode!r}")
+        vlm_pool_size = max(1, _env_int("VLM_POOL_SIZE", 1))
+        extraction_mode = _env_str("EXTRACTION_MODE", "ocr").lower()
+        if extraction_mode not in ("ocr", "cascade"):
+            raise ValueError(f"EXTRACTION_MODE must be 'ocr' or 'cascade', got {extraction_mode!r}")
+        cascade_scope = _env_str("CASCADE_SCOPE", "request").lower()
+        if cascade_scope not in ("request", "image"):
+            raise ValueError(f"CASCADE_SCOPE must be 'request' or 'image', got {cascade_scope!r}")
+        warmup_engines = tuple(
+            e.strip().lower() for e in _env_str("WARMUP_ENGINES", "ocr").split(",") if e.strip()
+        )
+        unknown = set(warmup_engines) - {"ocr", "vlm"}
+        if unknown:
+            raise ValueError(f"WARMUP_ENGINES accepts 'ocr' and 'vlm', got {sorted(unknown)}")
+        model_profile = _env_str("OCR_MODEL_PROFILE", "fp32").lower()
+        if model_profile not in ("fp32", "int8"):
+            raise ValueError(f"OCR_MODEL_PROFILE must be 'fp32' or 'int8', got {model_profile!r}")
+        return cls(
+            ocr_executor=executor,
+            ocr_workers=ocr_workers,
+            ocr_max_long_edge=_env_int("OCR_MAX_LONG_EDGE", 2800),
+            ocr_max_pixels=_env_int("OCR_MAX_PIXELS", 0),
+            ocr_grayscale=_env_bool("OCR_GRAYSCALE", False),
+            ocr_tile_height=_env_int("OCR_TILE_HEIGHT", 1600),
+            ocr_tile_overlap=_env_int("OCR_TILE_OVERLAP", 200),
+            ocr_tile_min_aspect=_env_float("OCR_TILE_MIN_ASPECT", 3.0),
+            ocr_tile_workers=max(1, _env_int("OCR_TILE_WORKERS", 2)),
+            ocr_rec_cache_entries=max(0, _env_int("OCR_REC_CACHE_ENTRIES", 2048)),
+            ocr_intra_op_threads=max(0, _env_int("OCR_INTRA_OP_THREADS", tuned.get("ocr_intra_op_threads", 0))),
+            ocr_inter_op_threads=max(0, _env_int("OCR_INTER_OP_THREADS", tuned.get("ocr_inter_op_threads", 0))),
+            ocr_graph_optimization=graph_optimization,
+            ocr_execution_mode=execution_mode,
+            ocr_mem_arena=_env_bool("OCR_MEM_ARENA", tuned.get("ocr_mem_arena", False)),
+            ocr_det_model=_env_str("OCR_DET_MODEL", ""),
+            ocr_rec_model=_env_str("OCR_REC_MODEL", ""),
+            ocr_cls_model=_env_str("OCR_CLS_MODEL", ""),
+            ocr_rec_keys=_env_str("OCR_REC_KEYS", ""),
+            ocr_model_profile=model_profile,
+            ocr_int8_model_dir=_env_str("OCR_INT8_MODEL_DIR", cls.ocr_int8_model_dir),
+            ocr_tuning_file=tuning_file,
+            ocr_screenshot_dedup=_env_bool("OCR_SCREENSHOT_DEDUP", True),
+            ocr_cache_entries=_env_int("OCR_CACHE_ENTRIES", 256),
+            ocr_cache_ttl_seconds=_env_int("OCR_CACHE_TTL_SECONDS", 24 * 60 * 60),
+            ocr_cache_dir=_env_str("OCR_CACHE_DIR", ".cache/ocr"),
+            ocr_cache_disk_mb=_env_int("OCR_CACHE_DISK_MB", 512),
+            vlm_model_path=_env_str("VLM_MODEL_PATH", cls.vlm_model_path),
+            vlm_mmproj_path=_env_str("VLM_MMPROJ_PATH", cls.vlm_mmproj_path),
+            vlm_pool_size=vlm_pool_size,
+            vlm_threads=max(1, _env_int("VLM_THREADS", max(1, (os.cpu_count() or 1) // vlm_pool_size))),
+            vlm_queue_timeout_seconds=_env_float("VLM_QUEUE_TIMEOUT_SECONDS", 60.0),
+            vlm_crop=_env_bool("VLM_CROP", True),
+            vlm_image_size=_env_int("VLM_IMAGE_SIZE", 384),
+            vlm_jpeg_quality=min(95, max(1, _env_int("VLM_JPEG_QUALITY", 90))),
+            extraction_mode=extraction_mode,
+            cascade_min_score=_env_float("CASCADE_MIN_SCORE", 0.75),
+            cascade_scope=cascade_scope,
+            menu_catalog_path=_env_str("MENU_CATALOG_PATH", _BUNDLED_MENU),
+            job_workers=max(1, _env_int("JOB_WORKERS", ocr_workers)),
+            job_queue_size=max(1, _env_int("JOB_QUEUE_SIZE", 100)),
+            job_result_ttl_seconds=_env_int("JOB_RESULT_TTL_SECONDS", 10 * 60),
+            warmup_engines=warmup_engines,
+        )
+
+
+settings = Settings.from_env()
@@ -1,14 +1,109 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
+import asyncio
+import logging
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Any
+
+_IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.middleware.cors import CORSMiddleware  # noqa: E402
+from fastapi.responses import JSONResponse, PlainTextResponse  # noqa: E402
+
+from app.api.ocr import MAX_BATCH_FILES, MAX_REQUEST_SIZE, router as ocr_router  # noqa: E402
+from app.api.vlm import router as vlm_router  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.middleware import BodySizeLimitMiddleware, MetricsMiddleware  # noqa: E402
+from app.services import metrics  # noqa: E402
+from app.services.job_queue import job_queue  # noqa: E402
+from app.services.ocr_cache import ocr_cache  # noqa: E402
+from app.services.ocr_pool import run_in_pool, shutdown_executor  # noqa: E402
+from app.services.vlm_service import shutdown_executor as shutdown_vlm_executor  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+# Readiness: "starting" until every configured engine has run once
+_startup: dict[str, Any] = {"status": "starting", "stages": {}, "error": None}
+
+metrics.Gauge(
+    "ust_ready",
+    "1 once startup warmup has finished and the API is ready for traffic.",
+    callback=lambda: {(): 1 if _startup["status"] == "ready" else 0},
+)
+
+
+def _record_stage(stage: str, seconds: float) -> None:
+    _startup["stages"][stage] = round(seconds, 3)
+    metrics.STAGE_SECONDS.observe(seconds, stage=f"startup_{stage}")
+    logger.info(f"Startup: {stage} took {seconds:.2f}s")
+
+
+async def _warmup() -> None:
+    """Load the configured engines off the event loop and run one inference each."""
+    started = time.perf_counter()
+    try:
+        # The parser's menu catalog is small; load it before the first receipt needs it
+        from app.services.menu_catalog import get_catalog
+
+        t0 = time.perf_counter()
+        await asyncio.to_thread(get_catalog)
+        _record_stage("menu_catalog", time.perf_counter() - t0)
+        # Sizing the on-disk OCR cache scans its directory; keep it off import
+        t0 = time.perf_counter()
+        await asyncio.to_thread(ocr_cache.open)
+        _record_stage("ocr_cache", time.perf_counter() - t0)
+        if "ocr" in settings.warmup_engines:
+            from app.services import ocr_service
+
+            # Threads share one engine; each process worker needs its own warm call
+            calls = settings.ocr_workers if settings.ocr_executor == "process" else 1
+            results = await asyncio.gather(*(run_in_pool(ocr_service.warmup) for _ in range(calls)))
+            for stage in results[0]:
+                _record_stage(stage, max(r[stage] for r in results))
+        if "vlm" in settings.warmup_engines:
+            from app.services import vlm_service
+
+            for stage, seconds in (await vlm_service.run_in_vlm_executor(vlm_service.warmup)).items():
+                _record_stage(stage, seconds)
+    except Exception as e:
+        logger.error(f"Startup warmup failed: {e}")
+        _startup["status"] = "failed"
+        _startup["error"] = str(e)
+        return
+    _record_stage("warmup_total", time.perf_counter() - started)
+    _startup["status"] = "ready"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    _record_stage("app_import", time.perf_counter() - _IMPORT_STARTED)
+    # Warm up in the background so the server accepts connections (and /ready) right away
+    warmup_task = asyncio.create_task(_warmup(), name="warmup")
+    yield
+    warmup_task.cancel()
+    await asyncio.gather(warmup_task, return_exceptions=True)
+    await job_queue.stop()
+    # Let in-flight OCR finish before the process exits
+    shutdown_executor()
+    shutdown_vlm_executor()
 
-from app.api.ocr import router as ocr_router
 
 app = FastAPI(
     title="UST McDelivery API",
     description="OCR-based McDonald's receipt processing for HKUST delivery platform",
     version="0.1.0",
+    lifespan=lifespan,
+)
+
+# Abort oversized request bodies while they stream in (allow multipart overhead)
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    max_bytes=MAX_REQUEST_SIZE + MAX_BATCH_FILES * 64 * 1024,
 )
 
+app.add_middleware(MetricsMiddleware)
+
 # CORS — allow all origins for development
 app.add_middleware(
     CORSMiddleware,
@@ -19,6 +114,7 @@ app.add_middleware(
 )
 
 app.include_router(ocr_router)
+app.include_router(vlm_router)
 
 
 @app.get("/")
@@ -26,6 +122,19 @@ def health_check() -> dict[str, str]:
     return {"status": "ok", "service": "UST McDelivery API"}
 
 
+@app.get("/ready")
+def readiness_check() -> JSONResponse:
+    """200 once the engines are loaded and warmed up, 503 before (or if that failed)."""
+    code = 200 if _startup["status"] == "ready" else 503
+    return JSONResponse(_startup, status_code=code)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics() -> PlainTextResponse:
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     import uvicorn
 
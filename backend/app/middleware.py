@@ -0,0 +1,132 @@
+"""ASGI middleware shared by all routes."""
+
+import json
+
+from starlette.exceptions import HTTPException
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services.metrics import HTTP_ERRORS, HTTP_REQUESTS, IN_FLIGHT
+
+
+class _BodyTooLarge(HTTPException):
+    """Raised from `receive`; an HTTPException so FastAPI's body parsing
+    re-raises it as a 413 instead of wrapping it in a generic 400."""
+
+    def __init__(self, max_bytes: int) -> None:
+        super().__init__(status_code=413, detail=f"Request body exceeds {max_bytes} bytes")
+
+
+class BodySizeLimitMiddleware:
+    """Reject request bodies larger than `max_bytes` while they stream in.
+
+    A declared Content-Length over the limit is refused before any body is
+    read; otherwise bytes are counted chunk by chunk as the app (e.g. the
+    multipart parser) consumes them, and the request is aborted with 413
+    as soon as the limit is crossed, so oversized uploads are never
+    buffered in full.
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int) -> None:
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    break
+                if declared > self.max_bytes:
+                    await self._reject(send)
+                    return
+                break
+
+        received = 0
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise _BodyTooLarge(self.max_bytes)
+            return message
+
+        async def tracking_send(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except _BodyTooLarge:
+            if not response_started:
+                await self._reject(send)
+
+    async def _reject(self, send: Send) -> None:
+        body = json.dumps(
+            {"detail": f"Request body exceeds {self.max_bytes} bytes"}
+        ).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"connection", b"close"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+# Probes whose 5xx answers are not failures: /ready is 503 until warmup ends
+_NO_ERROR_PATHS = frozenset({"/ready", "/metrics"})
+
+
+class MetricsMiddleware:
+    """Count requests, errors and in-flight requests per route.
+
+    Requests are labelled with the matched route template (e.g.
+    /api/ocr/jobs/{job_id}) rather than the raw path to bound cardinality.
+    Probe endpoints count as requests, never as errors.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def tracking_send(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        IN_FLIGHT.inc(kind="http_request")
+        try:
+            await self.app(scope, receive, tracking_send)
+        except Exception:
+            status = 500
+            raise
+        finally:
+            IN_FLIGHT.dec(kind="http_request")
+            route = scope.get("route")
+            path = getattr(route, "path", "<unmatched>")
+            method = scope["method"]
+            HTTP_REQUESTS.inc(method=method, path=path, status=str(status))
+            if status >= 500 and path not in _NO_ERROR_PATHS:
+                HTTP_ERRORS.inc(method=method, path=path)
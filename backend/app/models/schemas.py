@@ -7,6 +7,17 @@ class OrderItem(BaseModel):
     price: float
 
 
+class Routing(BaseModel):
+    """How a cascade-mode request was served."""
+
+    engine: str  # "ocr" or "ocr+vlm"
+    score: float
+    reasons: list[str]
+    escalated_images: list[int]
+    ocr_ms: float
+    vlm_ms: float = 0.0
+
+
 class OCRResponse(BaseModel):
     order_number: str
     restaurant: str = ""
@@ -16,3 +27,19 @@ class OCRResponse(BaseModel):
     is_valid: bool
     errors: list[str]
     raw_text: list[str]
+    routing: Routing | None = None
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: str  # queued | running | done | failed
+    result: OCRResponse | None = None
+    error: str | None = None
+
+
+class BatchReceiptResult(BaseModel):
+    """One NDJSON line of a batch response: a receipt's result or its error."""
+
+    receipt: int
+    result: OCRResponse | None = None
+    error: str | None = None
@@ -0,0 +1,159 @@
+"""Confidence-routed OCR → VLM cascade.
+
+The fast OCR + parser result is scored from OCR confidences, parser
+validation errors and missing key fields. Only receipts scoring below
+CASCADE_MIN_SCORE are sent to the VLM, whose output then fills in or
+replaces the fields the OCR path could not get right.
+"""
+
+from typing import Any
+
+from app.config import settings
+from app.services.metrics import Counter
+from app.services.ocr_result import OCRResult
+from app.services.receipt_parser import contains_hkust, find_overlap, fingerprint, validate_totals
+
+# Score penalties per problem found in the OCR path
+_ERROR_PENALTIES = {
+    "Empty OCR result": 1.0,
+    "No items detected": 0.5,
+    "Subtotal mismatch": 0.3,
+    "Subtotal/Total mismatch": 0.3,
+}
+_MISSING_ORDER_PENALTY = 0.2
+_MISSING_TOTAL_PENALTY = 0.2
+_FAILED_IMAGE_PENALTY = 0.3
+
+# Text boxes below this confidence count as unreliable
+_LOW_CONFIDENCE = 0.6
+_TARGET_MEAN_CONFIDENCE = 0.85
+
+# Parser errors the VLM output can resolve, and the fields it then replaces
+_ITEM_ERRORS = {"No items detected", "Subtotal mismatch"}
+_TOTAL_ERRORS = {"Subtotal/Total mismatch"}
+
+CASCADE_ROUTES = Counter(
+    "ust_cascade_routes_total",
+    "Cascade routing decisions: receipts kept on OCR or escalated to the VLM.",
+    ("route",),
+)
+
+
+def score_image(ocr: OCRResult | None) -> tuple[float, list[str]]:
+    """Score one image's OCR output in [0, 1] from its text-box confidences."""
+    if ocr is None:
+        return 1.0 - _FAILED_IMAGE_PENALTY, ["OCR failed"]
+    if not len(ocr):
+        return 0.0, ["no text found"]
+
+    reasons: list[str] = []
+    score = 1.0
+    mean = float(ocr.confidences.mean())
+    if mean < _TARGET_MEAN_CONFIDENCE:
+        score -= 2 * (_TARGET_MEAN_CONFIDENCE - mean)
+        reasons.append(f"mean confidence {mean:.2f}")
+    low = float((ocr.confidences < _LOW_CONFIDENCE).mean())
+    if low > 0.2:
+        score -= low / 2
+        reasons.append(f"{low:.0%} low-confidence boxes")
+    return max(0.0, score), reasons
+
+
+def score_receipt(parsed: dict[str, Any], image_scores: list[float]) -> tuple[float, list[str]]:
+    """Score a parsed receipt in [0, 1]; reasons explain every deduction."""
+    reasons: list[str] = []
+    score = min(image_scores, default=0.0)
+    if score < 1.0:
+        reasons.append(f"worst image score {score:.2f}")
+
+    for error in parsed.get("errors", []):
+        penalty = _ERROR_PENALTIES.get(error, _FAILED_IMAGE_PENALTY)
+        score -= penalty
+        reasons.append(error)
+    if not parsed.get("order_number"):
+        score -= _MISSING_ORDER_PENALTY
+        reasons.append("missing order number")
+    if not parsed.get("total"):
+        score -= _MISSING_TOTAL_PENALTY
+        reasons.append("missing total")
+    return max(0.0, score), reasons
+
+
+def images_to_escalate(receipt_score: float, image_scores: list[float]) -> list[int]:
+    """Indexes of the images to send to the VLM (empty: keep the OCR result).
+
+    With CASCADE_SCOPE=image only the low-scoring images go, unless the
+    problem is not tied to any one image (then all of them do).
+    """
+    if receipt_score >= settings.cascade_min_score:
+        return []
+    everything = list(range(len(image_scores)))
+    if settings.cascade_scope == "request":
+        return everything
+    weak = [i for i, s in enumerate(image_scores) if s < settings.cascade_min_score]
+    return weak or everything
+
+
+def _item_fingerprint(item: dict[str, Any]) -> str:
+    return fingerprint(f"{item.get('name', '')}{item.get('quantity', '')}")
+
+
+def _merge_items(items_per_image: list[list[dict[str, Any]]]) -> list[dict[str, Any]]:
+    """Items of consecutive screenshots, those in their overlap listed once.
+
+    The screenshots of one receipt overlap, so the VLM reads the items in
+    the shared band from both; they are aligned like OCR rows in
+    `merge_screenshots`.
+    """
+    items: list[dict[str, Any]] = []
+    fps: list[str] = []
+    for image_items in items_per_image:
+        new_fps = [_item_fingerprint(i) for i in image_items]
+        overlap = find_overlap(fps, new_fps)
+        items.extend(image_items[overlap:])
+        fps.extend(new_fps[overlap:])
+    return items
+
+
+def merge_vlm(
+    parsed: dict[str, Any],
+    vlm_results: list[dict[str, Any]],
+    raw_text: list[str],
+) -> dict[str, Any]:
+    """Fill the OCR parse with VLM output where OCR was missing or inconsistent.
+
+    VLM results are per image, in upload order; header fields come from
+    the first image that has them and payment fields from the last.
+    """
+    usable = [r for r in vlm_results if not r.get("errors")]
+    merged = dict(parsed)
+    merged["errors"] = list(parsed.get("errors", []))
+    merged["errors"].extend(e for r in vlm_results for e in r.get("errors", []))
+    if not usable:
+        return merged
+
+    ocr_errors = set(parsed.get("errors", []))
+    order_number = next((r["order_number"] for r in usable if r.get("order_number")), "")
+    restaurant = next((r["restaurant"] for r in usable if r.get("restaurant")), "")
+    items = _merge_items([r.get("items", []) for r in usable])
+    subtotal = next((r["subtotal"] for r in reversed(usable) if r.get("subtotal")), 0.0)
+    total = next((r["total"] for r in reversed(usable) if r.get("total")), 0.0)
+
+    if not merged.get("order_number"):
+        merged["order_number"] = order_number
+    if not merged.get("restaurant"):
+        merged["restaurant"] = restaurant
+    if items and (not merged.get("items") or ocr_errors & _ITEM_ERRORS):
+        merged["items"] = items
+    if subtotal and (not merged.get("subtotal") or ocr_errors & (_ITEM_ERRORS | _TOTAL_ERRORS)):
+        merged["subtotal"] = subtotal
+    if total and (not merged.get("total") or ocr_errors & _TOTAL_ERRORS):
+        merged["total"] = total
+
+    # Re-validate what we ended up with; OCR-side errors that the VLM fixed go away
+    validation = validate_totals(merged["items"], merged["subtotal"], merged["total"])
+    other_errors = [e for e in merged["errors"] if e not in _ERROR_PENALTIES]
+    merged["errors"] = validation + other_errors
+    mentions_hkust = contains_hkust(" ".join(raw_text)) or any(r.get("is_valid") for r in usable)
+    merged["is_valid"] = mentions_hkust and not merged["errors"]
+    return merged
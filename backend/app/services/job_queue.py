@@ -0,0 +1,127 @@
+"""In-process job queue for asynchronous receipt processing.
+
+Jobs are submitted as zero-argument coroutine factories, run by a fixed
+number of asyncio worker tasks, and kept for a configurable time after
+they finish so clients can poll for the result.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from app.config import settings
+from app.services.metrics import IN_FLIGHT, Gauge
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Raised when the backlog is at capacity and a job cannot be accepted."""
+
+
+@dataclass
+class Job:
+    id: str
+    status: str = QUEUED
+    result: Any = None
+    error: str | None = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+
+
+class JobQueue:
+    def __init__(self, workers: int, max_queued: int, result_ttl_seconds: float) -> None:
+        self.workers = workers
+        self.max_queued = max_queued
+        self.result_ttl_seconds = result_ttl_seconds
+
+        self._jobs: dict[str, Job] = {}
+        self._queue: asyncio.Queue[tuple[Job, Callable[[], Awaitable[Any]]]] | None = None
+        self._tasks: list[asyncio.Task[None]] = []
+
+    def _ensure_started(self) -> None:
+        """Start worker tasks on the running event loop (idempotent)."""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queued)
+            self._tasks = [
+                asyncio.create_task(self._worker(), name=f"job-worker-{i}")
+                for i in range(self.workers)
+            ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def submit(self, work: Callable[[], Awaitable[Any]]) -> Job:
+        """Enqueue `work` and return its job immediately."""
+        self._ensure_started()
+        assert self._queue is not None
+        self._purge_expired()
+
+        job = Job(id=uuid.uuid4().hex)
+        try:
+            self._queue.put_nowait((job, work))
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Job queue is full ({self.max_queued} pending)")
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        self._purge_expired()
+        return self._jobs.get(job_id)
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _worker(self) -> None:
+        assert self._queue is not None
+        queue = self._queue
+        while True:
+            job, work = await queue.get()
+            job.status = RUNNING
+            try:
+                with IN_FLIGHT.track(kind="job"):
+                    job.result = await work()
+                job.status = DONE
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {e}")
+                job.error = str(e)
+                job.status = FAILED
+            finally:
+                job.finished_at = time.time()
+                queue.task_done()
+
+    def _purge_expired(self) -> None:
+        cutoff = time.time() - self.result_ttl_seconds
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+job_queue = JobQueue(
+    workers=settings.job_workers,
+    max_queued=settings.job_queue_size,
+    result_ttl_seconds=settings.job_result_ttl_seconds,
+)
+
+Gauge(
+    "ust_job_queue_depth",
+    "Receipt jobs waiting for a worker.",
+    callback=lambda: {(): job_queue.depth()},
+)
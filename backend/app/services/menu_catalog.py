@@ -0,0 +1,195 @@
+"""Memory-resident menu catalog for fuzzy matching of OCR'd item names.
+
+Every English and Chinese name in the catalog is indexed by its character
+trigrams and scored by the Dice coefficient of trigram sets. A noisy OCR
+name is only compared with names found in the posting lists of its
+rarest trigrams, so a lookup reads a few short lists instead of scanning
+every entry. Names go through the section-marker normalization (case,
+width, simplified → traditional) with punctuation reduced to spaces.
+
+Parenthesized qualifiers — sizes like "(M)" / "(中)" and counts like
+"(6pcs)" — must agree when both sides carry them, so "Fries (M)" never
+resolves to "Fries (L)" however similar the rest of the name is. Words
+that make another product of the same name — "Meal" / "套餐", "Double" /
+"雙層" and a "w ..." / "配..." tail — must be on both sides or neither.
+
+Prices are optional: entries that carry one price the matched item, and
+"addon" entries raise the price of the item they are listed under.
+"""
+
+import json
+import logging
+import math
+import re
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+from app.config import settings
+from app.services.section_markers import normalize
+
+logger = logging.getLogger(__name__)
+
+# Lowest trigram Dice score accepted as the same name; a match replaces
+# the OCR text, so only near-exact reads qualify
+MIN_SCORE = 0.9
+# Distinct (text, kinds, min_score) lookups remembered per catalog
+MATCH_CACHE_SIZE = 4096
+# What a receipt line can be: ordered products, or upcharges listed under them
+ORDER_KINDS = ("item", "meal")
+ADDON_KINDS = ("addon",)
+
+_NON_WORD = re.compile(r"[\W_]+")
+_QUALIFIER = re.compile(r"\(([^()]*)\)")
+# (variant, pattern on the folded name) for words that change the product
+_VARIANTS = (
+    ("meal", re.compile(r"meal|套餐")),
+    ("double", re.compile(r"double|雙層")),
+    ("with", re.compile(r"\bw\b|配")),
+)
+
+
+@dataclass(frozen=True)
+class MenuEntry:
+    name: str
+    name_zh: str
+    kind: str  # "item", "meal" or "addon"
+    price: float | None = None  # unit price, or an add-on's upcharge
+
+
+@dataclass(frozen=True)
+class MenuMatch:
+    entry: MenuEntry
+    name: str  # canonical name, in the language of the matched text
+    score: float
+
+
+def _fold(text: str) -> tuple[str, frozenset[str], frozenset[str]]:
+    """Normalized name, its parenthesized qualifiers and its variant words."""
+    text = normalize(text)
+    qualifiers = frozenset(q for q in (_NON_WORD.sub("", m) for m in _QUALIFIER.findall(text)) if q)
+    folded = " ".join(_NON_WORD.sub(" ", text).split())
+    variants = frozenset(name for name, pattern in _VARIANTS if pattern.search(folded))
+    return folded, qualifiers, variants
+
+
+def _trigrams(name: str) -> frozenset[str]:
+    padded = f"  {name} "
+    return frozenset(padded[i : i + 3] for i in range(len(padded) - 2))
+
+
+def _compatible(
+    qualifiers: frozenset[str], variants: frozenset[str], key_qualifiers: frozenset[str], key_variants: frozenset[str]
+) -> bool:
+    """Variant words must agree; qualifiers conflict only when both names
+    carry them (OCR may drop parentheses)."""
+    if variants != key_variants:
+        return False
+    return not (qualifiers and key_qualifiers) or qualifiers == key_qualifiers
+
+
+class MenuCatalog:
+    """Trigram-indexed lookup over English and Chinese menu names."""
+
+    def __init__(self, entries: list[MenuEntry]) -> None:
+        self.entries = entries
+        # One key per indexed name: (entry, display name, qualifiers, variants, trigrams)
+        self._keys: list[tuple[MenuEntry, str, frozenset[str], frozenset[str], frozenset[str]]] = []
+        self._exact: dict[str, list[int]] = defaultdict(list)
+        self._index: dict[str, list[int]] = defaultdict(list)
+        for entry in entries:
+            for name in dict.fromkeys(n for n in (entry.name, entry.name_zh) if n):
+                folded, qualifiers, variants = _fold(name)
+                if not folded:
+                    continue
+                key_id = len(self._keys)
+                grams = _trigrams(folded)
+                self._keys.append((entry, name, qualifiers, variants, grams))
+                self._exact[folded].append(key_id)
+                for gram in grams:
+                    self._index[gram].append(key_id)
+        # The same item names recur across receipts and parser runs
+        self._cached_match = lru_cache(maxsize=MATCH_CACHE_SIZE)(self._match)
+
+    @classmethod
+    def from_file(cls, path: str | Path) -> "MenuCatalog":
+        """Load a JSON list of {name, name_zh, kind, price} objects (all but name optional)."""
+        with open(path, encoding="utf-8") as f:
+            raw = json.load(f)
+        return cls(
+            [
+                MenuEntry(
+                    name=e["name"],
+                    name_zh=e.get("name_zh", ""),
+                    kind=e.get("kind", "item"),
+                    price=None if e.get("price") is None else float(e["price"]),
+                )
+                for e in raw
+            ]
+        )
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def match(
+        self, text: str, kinds: tuple[str, ...] = ORDER_KINDS, min_score: float = MIN_SCORE
+    ) -> MenuMatch | None:
+        """Best catalog entry of one of `kinds` for `text`, or None below `min_score`."""
+        return self._cached_match(text, kinds, min_score)
+
+    def _match(self, text: str, kinds: tuple[str, ...], min_score: float) -> MenuMatch | None:
+        folded, qualifiers, variants = _fold(text)
+        if not folded:
+            return None
+
+        for key_id in self._exact.get(folded, ()):
+            entry, name, key_qualifiers, key_variants, _ = self._keys[key_id]
+            if entry.kind in kinds and _compatible(qualifiers, variants, key_qualifiers, key_variants):
+                return MenuMatch(entry, name, 1.0)
+
+        grams = _trigrams(folded)
+        best: MenuMatch | None = None
+        for key_id in self._candidates(grams, min_score):
+            entry, name, key_qualifiers, key_variants, key_grams = self._keys[key_id]
+            if entry.kind not in kinds:
+                continue
+            if not _compatible(qualifiers, variants, key_qualifiers, key_variants):
+                continue
+            score = 2 * len(grams & key_grams) / (len(grams) + len(key_grams))
+            if score >= min_score and (best is None or score > best.score):
+                best = MenuMatch(entry, name, score)
+        return best
+
+    def _candidates(self, grams: frozenset[str], min_score: float) -> set[int]:
+        """Keys that can score `min_score` against a name with these trigrams.
+
+        A name scoring >= t shares at least t*|Q|/(2-t) of the query's
+        trigrams, so it must contain one of the rarest |Q| - that + 1 of
+        them: only those posting lists are read (prefix filtering).
+        """
+        needed = math.ceil(min_score * len(grams) / (2 - min_score))
+        rarest = sorted(grams, key=lambda g: len(self._index.get(g, ())))
+        return {k for g in rarest[: len(grams) - needed + 1] for k in self._index.get(g, ())}
+
+
+# Loaded once on first use and kept for the life of the process
+_catalog: MenuCatalog | None = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> MenuCatalog:
+    """The configured catalog; empty when disabled or unreadable."""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                catalog = MenuCatalog([])
+                if settings.menu_catalog_path:
+                    try:
+                        catalog = MenuCatalog.from_file(settings.menu_catalog_path)
+                    except (OSError, ValueError, KeyError) as e:
+                        logger.warning(f"Menu catalog not loaded from {settings.menu_catalog_path}: {e}")
+                _catalog = catalog
+    return _catalog
@@ -0,0 +1,246 @@
+"""Content-addressed cache for OCR results.
+
+Results of `extract_text_with_metadata` are stored under a hash of the raw
+image bytes: a bounded in-memory LRU of `OCRResult` objects sits in front
+of a persistent on-disk store of one JSON file per image. Both tiers
+honour the same TTL.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from app.config import settings
+from app.services.metrics import Counter
+from app.services.ocr_result import OCRResult
+
+logger = logging.getLogger(__name__)
+
+# Bump when the OCR output format or pipeline changes to orphan old entries
+CACHE_VERSION = "5"
+
+# Settings that change what OCR returns for the same bytes: preprocessing,
+# tiling, model files and ORT session options. The disk tier outlives the
+# process, so results made under another configuration must not be served
+_OUTPUT_SETTINGS = (
+    "ocr_max_long_edge",
+    "ocr_max_pixels",
+    "ocr_grayscale",
+    "ocr_tile_height",
+    "ocr_tile_overlap",
+    "ocr_tile_min_aspect",
+    "ocr_graph_optimization",
+    "ocr_execution_mode",
+    "ocr_det_model",
+    "ocr_rec_model",
+    "ocr_cls_model",
+    "ocr_rec_keys",
+    "ocr_model_profile",
+    "ocr_int8_model_dir",
+)
+_SETTINGS_TAG = json.dumps({name: getattr(settings, name) for name in _OUTPUT_SETTINGS}, sort_keys=True)
+
+
+def image_key(image_bytes: bytes, top: int = 0) -> str:
+    """Content address of an uploaded image (under the current OCR settings),
+    OCR'd from row `top` down."""
+    h = hashlib.sha256()
+    h.update(CACHE_VERSION.encode())
+    h.update(_SETTINGS_TAG.encode())
+    if top:
+        h.update(f"top={top}".encode())
+    h.update(image_bytes)
+    return h.hexdigest()
+
+
+class OCRCache:
+    """Two-tier (memory LRU + disk) cache with size and TTL eviction."""
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        disk_dir: str | None = None,
+        disk_max_bytes: int = 0,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+
+        self._memory: OrderedDict[str, tuple[float, OCRResult]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+        self._disk_opened = False
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # ─── public API ───
+
+    def open(self) -> None:
+        """Create the disk directory and size its contents; run at startup
+        (warmup), or on the first disk access otherwise."""
+        if self.disk_dir is None or self._disk_opened:
+            return
+        with self._lock:
+            if self._disk_opened:
+                return
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._disk_bytes = sum(p.stat().st_size for p in self.disk_dir.glob("*.json"))
+            self._disk_opened = True
+
+    def get(self, key: str) -> OCRResult | None:
+        now = time.time()
+        with self._lock:
+            hit = self._memory.get(key)
+            if hit is not None:
+                stored_at, value = hit
+                if now - stored_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+
+        value = self._disk_get(key, now)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._memory_put(key, value, now)
+        return value
+
+    def put(self, key: str, value: OCRResult) -> None:
+        now = time.time()
+        with self._lock:
+            self._memory_put(key, value, now)
+        self._disk_put(key, value)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+            }
+
+    # ─── memory tier ───
+
+    def _memory_put(self, key: str, value: OCRResult, now: float) -> None:
+        """Insert into the LRU; caller must hold the lock."""
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = (now, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    # ─── disk tier ───
+
+    def _path(self, key: str) -> Path:
+        assert self.disk_dir is not None
+        return self.disk_dir / f"{key}.json"
+
+    def _disk_get(self, key: str, now: float) -> OCRResult | None:
+        if self.disk_dir is None:
+            return None
+        self.open()
+        path = self._path(key)
+        try:
+            stat = path.stat()
+            if now - stat.st_mtime > self.ttl_seconds:
+                self._disk_remove(path, stat.st_size)
+                return None
+            with open(path, encoding="utf-8") as f:
+                return OCRResult.from_json(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Dropping unreadable OCR cache entry {path.name}: {e}")
+            self._disk_remove(path, 0)
+            return None
+
+    def _disk_put(self, key: str, value: OCRResult) -> None:
+        if self.disk_dir is None or self.disk_max_bytes <= 0:
+            return
+        self.open()
+        path = self._path(key)
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        try:
+            data = json.dumps(value.to_json(), ensure_ascii=False).encode("utf-8")
+            old_size = path.stat().st_size if path.exists() else 0
+            tmp.write_bytes(data)
+            os.replace(tmp, path)  # atomic: readers never see a partial file
+        except OSError as e:
+            logger.warning(f"Could not write OCR cache entry {path.name}: {e}")
+            tmp.unlink(missing_ok=True)
+            return
+
+        with self._lock:
+            self._disk_bytes += len(data) - old_size
+            over_budget = self._disk_bytes > self.disk_max_bytes
+        if over_budget:
+            self._disk_evict()
+
+    def _disk_remove(self, path: Path, size: int) -> None:
+        try:
+            path.unlink()
+        except OSError:
+            return
+        with self._lock:
+            self._disk_bytes = max(0, self._disk_bytes - size)
+
+    def _disk_evict(self) -> None:
+        """Drop expired entries, then oldest ones, down to 90% of the budget."""
+        assert self.disk_dir is not None
+        now = time.time()
+        entries = []
+        for p in self.disk_dir.glob("*.json"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        target = int(self.disk_max_bytes * 0.9)
+        for mtime, size, p in entries:
+            if total <= target and now - mtime <= self.ttl_seconds:
+                break
+            try:
+                p.unlink()
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+
+ocr_cache = OCRCache(
+    max_entries=settings.ocr_cache_entries,
+    ttl_seconds=settings.ocr_cache_ttl_seconds,
+    disk_dir=settings.ocr_cache_dir or None,
+    disk_max_bytes=settings.ocr_cache_disk_mb * 1024 * 1024,
+)
+
+Counter(
+    "ust_ocr_cache_hits_total",
+    "OCR results served from the cache, by tier.",
+    ("tier",),
+    callback=lambda: {("memory",): ocr_cache.memory_hits, ("disk",): ocr_cache.disk_hits},
+)
+Counter(
+    "ust_ocr_cache_misses_total",
+    "OCR cache lookups that had to run OCR.",
+    callback=lambda: {(): ocr_cache.misses},
+)
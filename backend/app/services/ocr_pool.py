@@ -0,0 +1,63 @@
+"""Bounded worker pool that keeps CPU-bound OCR off the asyncio event loop."""
+
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Singleton executor — created on first use, torn down on app shutdown
+_executor: Executor | None = None
+
+
+def _init_process_worker() -> None:
+    """Build a private RapidOCR instance inside each worker process."""
+    from app.services import ocr_service
+
+    ocr_service._get_engine()
+
+
+def get_executor() -> Executor:
+    """Return the shared OCR executor, creating it from settings if needed."""
+    global _executor
+    if _executor is None:
+        if settings.ocr_executor == "process":
+            # spawn, not fork: ONNX Runtime thread pools don't survive a fork
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.ocr_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_process_worker,
+            )
+        else:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ocr_workers,
+                thread_name_prefix="ocr",
+            )
+        logger.info(
+            f"OCR pool started: {settings.ocr_executor} x {settings.ocr_workers}"
+        )
+    return _executor
+
+
+def shutdown_executor() -> None:
+    """Stop the OCR executor, waiting for in-flight work to finish."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+
+async def run_in_pool(fn: Callable[..., T], *args: Any) -> T:
+    """Run `fn(*args)` on the OCR pool without blocking the event loop.
+
+    With a process pool, `fn` and its arguments must be picklable
+    (module-level functions and plain data).
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), fn, *args)
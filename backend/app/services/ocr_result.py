@@ -0,0 +1,96 @@
+"""Columnar OCR output shared by ocr_service, the OCR cache and receipt_parser.
+
+One image's text boxes are kept as parallel arrays instead of one dict
+per box: corner points as a single (N, 4, 2) float32 array, with centres
+and heights computed from it in one vectorized pass. The per-box dict
+form exists only for tools and debugging (`to_dicts`), and the JSON form
+only for the on-disk cache (`to_json` / `from_json`).
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+class OCRResult:
+    """Text boxes of one image, sorted top to bottom, then left to right.
+
+    Box i is `boxes[i]` (corners clockwise from top-left, in original image
+    coordinates), `texts[i]`, `confidences[i]`, `centers_x[i]`,
+    `centers_y[i]` and `heights[i]`. `preprocess` holds the decode/resize
+    stats and stage timings of the OCR run.
+    """
+
+    __slots__ = ("boxes", "texts", "confidences", "centers_x", "centers_y", "heights", "preprocess")
+
+    def __init__(
+        self,
+        boxes: np.ndarray | list[Any],
+        texts: list[str],
+        confidences: np.ndarray | list[float],
+        preprocess: dict[str, Any] | None = None,
+    ) -> None:
+        import numpy as np
+
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4, 2)
+        confidences = np.asarray(confidences, dtype=np.float32).reshape(-1)
+        centers = boxes.mean(axis=1)
+        # lexsort sorts by the last key first: (y, x)
+        order = np.lexsort((centers[:, 0], centers[:, 1]))
+
+        self.boxes = boxes[order]
+        self.texts = [texts[i] for i in order.tolist()]
+        self.confidences = confidences[order]
+        self.centers_x = centers[order, 0]
+        self.centers_y = centers[order, 1]
+        # bottom-right y - top-left y
+        self.heights = self.boxes[:, 2, 1] - self.boxes[:, 0, 1]
+        self.preprocess = preprocess if preprocess is not None else {}
+
+    @classmethod
+    def from_raw(cls, raw: list[list[Any]] | None, preprocess: dict[str, Any] | None = None) -> OCRResult:
+        """Build from RapidOCR's [[bbox, text, confidence], ...] (None: nothing found)."""
+        raw = raw or []
+        return cls(
+            [bbox for bbox, _, _ in raw],
+            [text for _, text, _ in raw],
+            [confidence for _, _, confidence in raw],
+            preprocess,
+        )
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    @property
+    def full_text(self) -> str:
+        return "\n".join(self.texts)
+
+    def to_dicts(self) -> list[dict[str, Any]]:
+        """Per-box {text, bbox, height, confidence, avg_y, avg_x} dicts."""
+        return [
+            {"text": text, "bbox": bbox, "height": h, "confidence": c, "avg_y": y, "avg_x": x}
+            for text, bbox, h, c, y, x in zip(
+                self.texts,
+                self.boxes.tolist(),
+                self.heights.tolist(),
+                self.confidences.tolist(),
+                self.centers_y.tolist(),
+                self.centers_x.tolist(),
+            )
+        ]
+
+    def to_json(self) -> dict[str, Any]:
+        """JSON-serializable form; derived columns are rebuilt on load."""
+        return {
+            "boxes": self.boxes.tolist(),
+            "texts": self.texts,
+            "confidences": self.confidences.tolist(),
+            "preprocess": self.preprocess,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> OCRResult:
+        return cls(data["boxes"], data["texts"], data["confidences"], data.get("preprocess"))
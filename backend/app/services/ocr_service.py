@@ -1,85 +1,427 @@
+from __future__ import annotations
+
 import io
-import numpy as np
-from PIL import Image
-from rapidocr_onnxruntime import RapidOCR
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
 
-# Singleton OCR engine — initialized once, reused across requests
-_engine = RapidOCR()
+from app.config import settings
+from app.services.ocr_result import OCRResult
+from app.services.rec_cache import rec_cache
 
+# numpy, PIL and rapidocr are imported on first use so that importing the
+# app (tests, tools, the API process with a process pool) stays fast
+if TYPE_CHECKING:
+    import numpy as np
+    from onnxruntime import SessionOptions
+    from rapidocr_onnxruntime import RapidOCR
 
-def extract_text(image_bytes: bytes) -> list[str]:
-    """Run OCR on image bytes and return text lines sorted top-to-bottom."""
-    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    img_array = np.array(image)
+logger = logging.getLogger(__name__)
+
+
+# =========================================================
+# Engine factory
+# =========================================================
+
+# Quantized models of the "int8" profile, inside OCR_INT8_MODEL_DIR
+INT8_MODEL_FILES = {"det": "det_int8.onnx", "rec": "rec_int8.onnx"}
+
+_GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+
+@dataclass(frozen=True)
+class EngineOptions:
+    """ONNX Runtime session knobs and model files for one RapidOCR engine."""
+
+    intra_op_threads: int = 0  # 0: ONNX Runtime default
+    inter_op_threads: int = 0
+    graph_optimization: str = "all"
+    execution_mode: str = "sequential"
+    mem_arena: bool = False
+    det_model: str = ""  # "": RapidOCR's bundled model
+    rec_model: str = ""
+    cls_model: str = ""
+    rec_keys: str = ""
 
-    result, _ = _engine(img_array)
+    @classmethod
+    def from_settings(cls, profile: str | None = None) -> "EngineOptions":
+        """Options from settings; `profile` overrides OCR_MODEL_PROFILE.
 
-    if result is None:
-        return []
+        The "int8" profile loads det_int8.onnx / rec_int8.onnx from
+        OCR_INT8_MODEL_DIR (see benchmarks/quantize_ocr.py) unless an
+        explicit model path is set; classification stays FP32.
+        """
+        profile = profile or settings.ocr_model_profile
+        det_model, rec_model = settings.ocr_det_model, settings.ocr_rec_model
+        if profile == "int8":
+            det_model = det_model or os.path.join(settings.ocr_int8_model_dir, INT8_MODEL_FILES["det"])
+            rec_model = rec_model or os.path.join(settings.ocr_int8_model_dir, INT8_MODEL_FILES["rec"])
+        return cls(
+            intra_op_threads=settings.ocr_intra_op_threads,
+            inter_op_threads=settings.ocr_inter_op_threads,
+            graph_optimization=settings.ocr_graph_optimization,
+            execution_mode=settings.ocr_execution_mode,
+            mem_arena=settings.ocr_mem_arena,
+            det_model=det_model,
+            rec_model=rec_model,
+            cls_model=settings.ocr_cls_model,
+            rec_keys=settings.ocr_rec_keys,
+        )
 
-    # result is list of [bbox, text, confidence]
-    # bbox is [[x1,y1],[x2,y2],[x3,y3],[x4,y4]]
-    # Sort by average y-coordinate (top-to-bottom)
-    lines: list[tuple[float, str]] = []
-    for item in result:
-        bbox = item[0]
-        text = item[1]
-        avg_y = sum(point[1] for point in bbox) / len(bbox)
-        lines.append((avg_y, text))
 
-    lines.sort(key=lambda x: x[0])
-    return [text for _, text in lines]
+# What RapidOCR hard-codes in its own SessionOptions
+_LIBRARY_SESSION_DEFAULTS = ("all", "sequential", False)
 
 
-def extract_text_with_metadata(image_bytes: bytes) -> dict:
+def _session_options(options: EngineOptions) -> SessionOptions:
+    import onnxruntime as ort
+
+    sess_opts = ort.SessionOptions()
+    sess_opts.log_severity_level = 4
+    sess_opts.graph_optimization_level = getattr(
+        ort.GraphOptimizationLevel, _GRAPH_OPTIMIZATION_LEVELS[options.graph_optimization]
+    )
+    sess_opts.execution_mode = (
+        ort.ExecutionMode.ORT_PARALLEL if options.execution_mode == "parallel" else ort.ExecutionMode.ORT_SEQUENTIAL
+    )
+    sess_opts.enable_cpu_mem_arena = options.mem_arena
+    if options.intra_op_threads > 0:
+        sess_opts.intra_op_num_threads = options.intra_op_threads
+    if options.inter_op_threads > 0:
+        sess_opts.inter_op_num_threads = options.inter_op_threads
+    return sess_opts
+
+
+def build_engine(options: EngineOptions | None = None) -> RapidOCR:
+    """Build a RapidOCR engine from `options` (default: from settings).
+
+    Thread counts and model files go through RapidOCR's own parameters.
+    RapidOCR fixes the other session options, so when those differ from
+    its defaults the det / cls / rec sessions are rebuilt with ours.
     """
-    Run OCR on image bytes and return structured data with bounding box metadata.
-    
-    Returns:
-        dict with keys:
-        - ocr_results: list of dicts with {text, bbox, height, confidence, avg_y, avg_x}
-        - full_text: concatenated text (same as extract_text output)
+    from rapidocr_onnxruntime import RapidOCR
+
+    options = options or EngineOptions.from_settings()
+    kwargs: dict[str, Any] = {}
+    if options.intra_op_threads > 0:
+        kwargs["intra_op_num_threads"] = options.intra_op_threads
+    if options.inter_op_threads > 0:
+        kwargs["inter_op_num_threads"] = options.inter_op_threads
+    for stage, path in (("det", options.det_model), ("rec", options.rec_model), ("cls", options.cls_model)):
+        if path:
+            kwargs[f"{stage}_model_path"] = path
+    if options.rec_keys:
+        kwargs["rec_keys_path"] = options.rec_keys
+    engine = RapidOCR(**kwargs)
+    # RapidOCR pads every crop of a rec batch to the widest one, so a line's
+    # text depended on its neighbours; one crop per run is stable and, with
+    # no padding, faster (rec 7.3s vs 11.1s over 3 passes of the samples)
+    engine.text_rec.rec_batch_num = 1
+
+    if (options.graph_optimization, options.execution_mode, options.mem_arena) != _LIBRARY_SESSION_DEFAULTS:
+        import onnxruntime as ort
+
+        sess_opts = _session_options(options)
+        for wrapper in (engine.text_det.infer, engine.text_cls.infer, engine.text_rec.session):
+            old = wrapper.session
+            # InferenceSession keeps the path it was loaded from
+            wrapper.session = ort.InferenceSession(
+                old._model_path, sess_options=sess_opts, providers=old.get_providers()
+            )
+    logger.info(f"OCR engine built: {options}")
+    return engine
+
+
+# Singleton OCR engine — built once on first use (or at warmup), reused across requests
+_engine: RapidOCR | None = None
+_engine_lock = threading.Lock()
+
+
+def _get_engine() -> RapidOCR:
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = build_engine()
+    return _engine
+
+
+def _run_engine(
+    img_array: np.ndarray, engine: RapidOCR | None = None
+) -> tuple[list[list[Any]] | None, list[float] | None]:
+    """Run RapidOCR on one image, same contract as `_engine(img_array)`.
+
+    Mirrors RapidOCR.__call__ stage by stage so that recognition can go
+    through the crop cache. An explicit `engine` (e.g. another model
+    profile) bypasses it.
     """
-    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    img_array = np.array(image)
+    if engine is not None:
+        return engine(img_array)
+    engine = _get_engine()
+    # A cached line must read the same as a freshly recognised one, which
+    # holds only while each crop is recognised on its own (build_engine)
+    use_cache = settings.ocr_rec_cache_entries > 0 and engine.text_rec.rec_batch_num == 1
+    if not use_cache:
+        return engine(img_array)
+
+    img_array = engine.load_img(img_array)  # grayscale -> 3-channel
+    raw_h, raw_w = img_array.shape[:2]
+    img, ratio_h, ratio_w = engine.preprocess(img_array)
+    op_record: dict[str, Any] = {"preprocess": {"ratio_h": ratio_h, "ratio_w": ratio_w}}
+
+    img, op_record = engine.maybe_add_letterbox(img, op_record)
+    dt_boxes, det_elapse = engine.auto_text_det(img)
+    if dt_boxes is None:
+        return None, None
+    crops = engine.get_crop_img_list(img, dt_boxes)
+
+    cls_res, cls_elapse = None, 0.0
+    if engine.use_cls:
+        crops, cls_res, cls_elapse = engine.text_cls(crops)
+
+    rec_res, rec_elapse = rec_cache.recognize(crops, engine.text_rec)
 
-    result, _ = _engine(img_array)
+    dt_boxes = engine._get_origin_points(dt_boxes, op_record, raw_h, raw_w)
+    return engine.get_final_res(dt_boxes, cls_res, rec_res, det_elapse, cls_elapse, rec_elapse)
 
-    if result is None:
-        return {"ocr_results": [], "full_text": ""}
 
-    # Parse OCR results and calculate metadata
-    ocr_results: list[dict] = []
-    for item in result:
-        bbox = item[0]  # [[x1,y1],[x2,y2],[x3,y3],[x4,y4]]
-        text = item[1]
-        confidence = item[2]
+# =========================================================
+# Image normalization
+# =========================================================
 
-        # Calculate height: bottom-left Y - top-left Y
-        height = bbox[2][1] - bbox[0][1]
 
-        # Calculate average Y for sorting (top-to-bottom)
-        avg_y = sum(point[1] for point in bbox) / len(bbox)
+def _is_tall(width: int, height: int) -> bool:
+    """Long scrolling screenshots are OCR'd as overlapping strips."""
+    return (
+        settings.ocr_tile_height > 0
+        and height > settings.ocr_tile_height
+        and height / width >= settings.ocr_tile_min_aspect
+    )
 
-        # Calculate average X for horizontal position
-        avg_x = sum(point[0] for point in bbox) / len(bbox)
 
-        ocr_results.append({
-            "text": text,
-            "bbox": bbox,
-            "height": height,
-            "confidence": confidence,
-            "avg_y": avg_y,
-            "avg_x": avg_x
-        })
+def _target_size(width: int, height: int) -> tuple[int, int] | None:
+    """Size to OCR at under the long-edge / pixel-count caps, or None if
+    the image is already within both."""
+    scale = 1.0
+    if settings.ocr_max_long_edge > 0:
+        # Tall images are tiled, so only their width needs to fit the cap
+        long_edge = width if _is_tall(width, height) else max(width, height)
+        scale = min(scale, settings.ocr_max_long_edge / long_edge)
+    if settings.ocr_max_pixels > 0:
+        scale = min(scale, (settings.ocr_max_pixels / (width * height)) ** 0.5)
+    if scale >= 1.0:
+        return None
+    # One factor for both sides: snapping each to a multiple of 32 squeezed
+    # text (1179x2556 -> 896x1984) and cost boxes. Detection pads to 32 itself
+    return max(1, round(width * scale)), max(1, round(height * scale))
 
-    # Sort by vertical position (top-to-bottom)
-    ocr_results.sort(key=lambda x: x["avg_y"])
 
-    # Generate full text for backward compatibility
-    full_text = "\n".join([r["text"] for r in ocr_results])
+def _decode_image(image_bytes: bytes) -> tuple[np.ndarray, dict[str, Any]]:
+    """Decode and normalize an upload for OCR.
 
-    return {
-        "ocr_results": ocr_results,
-        "full_text": full_text
+    JPEGs are decoded in draft mode straight to the nearest 1/2, 1/4 or 1/8
+    scale above the target size, then resized to the exact target; the
+    image is optionally reduced to grayscale. Returns the pixel array and
+    a stats dict with the original/OCR sizes and per-stage timings, used
+    by `_to_original_coords` to map boxes back.
+    """
+    import numpy as np
+    from PIL import Image
+
+    t0 = time.perf_counter()
+    image = Image.open(io.BytesIO(image_bytes))
+    orig_w, orig_h = image.size
+    target = _target_size(orig_w, orig_h)
+    mode = "L" if settings.ocr_grayscale else "RGB"
+
+    drafted = False
+    if target is not None and image.format == "JPEG":
+        image.draft(mode, target)
+        drafted = image.size != (orig_w, orig_h)
+    image = image.convert(mode)
+    t1 = time.perf_counter()
+
+    if target is not None and image.size != target:
+        image = image.resize(target, Image.Resampling.BILINEAR, reducing_gap=3.0)
+    img_array = np.asarray(image)
+    t2 = time.perf_counter()
+
+    return img_array, {
+        "original_size": [orig_w, orig_h],
+        "ocr_size": [image.width, image.height],
+        "draft": drafted,
+        "decode_ms": (t1 - t0) * 1000,
+        "resize_ms": (t2 - t1) * 1000,
     }
+
+
+def _to_original_coords(result: OCRResult) -> OCRResult:
+    """Scale boxes from OCR-space back to the uploaded image, so parser
+    thresholds tuned on full-resolution screenshots still hold."""
+    import numpy as np
+
+    (orig_w, orig_h), (ocr_w, ocr_h) = result.preprocess["original_size"], result.preprocess["ocr_size"]
+    if (orig_w, orig_h) == (ocr_w, ocr_h):
+        return result
+    scale = np.array([orig_w / ocr_w, orig_h / ocr_h], dtype=np.float32)
+    return OCRResult(result.boxes * scale, result.texts, result.confidences, result.preprocess)
+
+
+# =========================================================
+# Tiled OCR for tall screenshots
+# =========================================================
+
+_tile_executor: ThreadPoolExecutor | None = None
+
+
+def _get_tile_executor() -> ThreadPoolExecutor:
+    global _tile_executor
+    if _tile_executor is None:
+        _tile_executor = ThreadPoolExecutor(
+            max_workers=settings.ocr_tile_workers, thread_name_prefix="ocr-tile"
+        )
+    return _tile_executor
+
+
+def _tile_bounds(height: int) -> list[tuple[int, int, int, int]]:
+    """Split [0, height) into overlapping strips.
+
+    Returns (top, bottom, own_top, own_bottom) per strip: the strip covers
+    rows [top, bottom) and owns boxes whose centre lies in
+    [own_top, own_bottom). Ownership boundaries sit in the middle of each
+    overlap band, so any line up to overlap/2 tall is wholly inside the
+    strip that owns it, and its cut-off copy in the neighbour is dropped.
+    """
+    tile, overlap = settings.ocr_tile_height, settings.ocr_tile_overlap
+    step = max(1, tile - overlap)
+    tops = list(range(0, max(1, height - overlap), step))
+    bounds = []
+    for i, top in enumerate(tops):
+        bottom = min(height, top + tile)
+        own_top = 0 if i == 0 else top + overlap // 2
+        own_bottom = height if i == len(tops) - 1 else bottom - overlap // 2
+        bounds.append((top, bottom, own_top, own_bottom))
+    return bounds
+
+
+def _run_tiled(img_array: np.ndarray, engine: RapidOCR | None = None) -> tuple[OCRResult, list[float]]:
+    """OCR horizontal strips in parallel and stitch boxes back together.
+
+    Returns the stitched result and [det, cls, rec] seconds summed over strips.
+    """
+    import numpy as np
+
+    bounds = _tile_bounds(img_array.shape[0])
+    strips = [img_array[top:bottom] for top, bottom, _, _ in bounds]
+    outputs = list(_get_tile_executor().map(lambda strip: _run_engine(strip, engine), strips))
+
+    boxes: list[np.ndarray] = []
+    texts: list[str] = []
+    confidences: list[np.ndarray] = []
+    elapse = [0.0, 0.0, 0.0]
+    for (top, _, own_top, own_bottom), (raw, strip_elapse) in zip(bounds, outputs):
+        for i, seconds in enumerate(strip_elapse or []):
+            elapse[i] += seconds
+        strip = OCRResult.from_raw(raw)
+        center_y = strip.centers_y + top
+        keep = (center_y >= own_top) & (center_y < own_bottom)
+        boxes.append(strip.boxes[keep] + np.array([0, top], dtype=np.float32))
+        texts.extend(t for t, k in zip(strip.texts, keep.tolist()) if k)
+        confidences.append(strip.confidences[keep])
+    return OCRResult(np.concatenate(boxes), texts, np.concatenate(confidences)), elapse
+
+
+def _run_ocr(image_bytes: bytes, engine: RapidOCR | None = None, top: int = 0) -> OCRResult:
+    """Decode, normalize and OCR an image (from row `top` down); boxes are
+    in original coordinates and the decode/OCR stats are in `preprocess`."""
+    import numpy as np
+
+    img_array, stats = _decode_image(image_bytes)
+    # Rows above `top` were already OCR'd in an overlapping screenshot
+    ocr_top = round(top * stats["ocr_size"][1] / stats["original_size"][1])
+    if ocr_top:
+        img_array = img_array[ocr_top:]
+    stats["top"] = top
+
+    t0 = time.perf_counter()
+    height, width = img_array.shape[:2]
+    stats["tiled"] = _is_tall(width, height)
+    if stats["tiled"]:
+        result, elapse = _run_tiled(img_array, engine)
+    else:
+        raw, elapse = _run_engine(img_array, engine)
+        result = OCRResult.from_raw(raw)
+    if ocr_top:
+        result = OCRResult(result.boxes + np.array([0, ocr_top], dtype=np.float32), result.texts, result.confidences)
+    stats["ocr_ms"] = (time.perf_counter() - t0) * 1000
+    # RapidOCR reports [det, cls, rec] seconds; shorter when nothing was found
+    det_s, cls_s, rec_s = ((elapse or []) + [0.0, 0.0, 0.0])[:3]
+    stats["det_ms"], stats["cls_ms"], stats["rec_ms"] = det_s * 1000, cls_s * 1000, rec_s * 1000
+
+    pixels_in = stats["original_size"][0] * stats["original_size"][1]
+    pixels_out = stats["ocr_size"][0] * stats["ocr_size"][1]
+    stats["pixel_ratio"] = pixels_out / pixels_in if pixels_in else 1.0
+    logger.debug(
+        "OCR %sx%s -> %sx%s (%.0f%% pixels, draft=%s): decode %.1fms, resize %.1fms, ocr %.1fms",
+        *stats["original_size"], *stats["ocr_size"], stats["pixel_ratio"] * 100,
+        stats["draft"], stats["decode_ms"], stats["resize_ms"], stats["ocr_ms"],
+    )
+
+    result.preprocess = stats
+    return _to_original_coords(result)
+
+
+def extract_text(image_bytes: bytes) -> list[str]:
+    """Run OCR on image bytes and return text lines sorted top-to-bottom."""
+    return _run_ocr(image_bytes).texts
+
+
+def extract_text_with_metadata(image_bytes: bytes, engine: RapidOCR | None = None, top: int = 0) -> OCRResult:
+    """
+    Run OCR on image bytes and return its text boxes in columnar form.
+
+    `engine` defaults to the shared engine; tools pass one from `build_engine`
+    to compare model profiles. A non-zero `top` skips the rows above it
+    (original pixels), e.g. the band a previous screenshot already showed.
+
+    The result is sorted top-to-bottom, then left-to-right; `full_text`
+    joins its lines and `preprocess` holds original/OCR image sizes and
+    per-stage timings (ms). Use `to_dicts()` for the per-box
+    {text, bbox, height, confidence, avg_y, avg_x} form.
+    """
+    return _run_ocr(image_bytes, engine, top)
+
+
+# =========================================================
+# Warmup
+# =========================================================
+
+
+def _warmup_image() -> bytes:
+    """A tiny built-in receipt line, so warmup needs no files on disk."""
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (320, 64), "white")
+    ImageDraw.Draw(image).text((12, 20), "Order # 123  HK$ 43.00", fill="black")
+    buf = io.BytesIO()
+    image.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def warmup() -> dict[str, float]:
+    """Load the engine and run one inference; returns per-stage seconds."""
+    t0 = time.perf_counter()
+    _get_engine()
+    t1 = time.perf_counter()
+    extract_text_with_metadata(_warmup_image())
+    t2 = time.perf_counter()
+    return {"ocr_load": t1 - t0, "ocr_warmup": t2 - t1}
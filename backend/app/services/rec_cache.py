@@ -0,0 +1,199 @@
+"""Recognition cache for text-line crops that recur across screenshots.
+
+The McDonald's app renders the same static labels ("Order Summary",
+"Payment Details", "訂單內容", "Subtotal", the HKUST restaurant name, ...)
+in the same font on every receipt. Between detection and recognition each
+crop is reduced to a small perceptual signature: the crop trimmed to its
+ink, contrast-normalized and scaled to SIGNATURE_HEIGHT rows. Signatures
+are bucketed by width; a crop whose signature matches a cached one within
+MATCH_TOLERANCE on every character-sized block skips the rec model.
+
+Exact hashes of the signature do not work here: a different detection box,
+JPEG noise or a resize at another sub-pixel phase flips some of the bits
+of every crop. The per-block check still tells "163" from "168".
+
+Taking hits out of the rec input does not change how the misses read,
+since the engine recognises every crop on its own (rec_batch_num=1);
+benchmarks/rec_cache_check.py compares cached and uncached output.
+
+Only confident results are stored; a bounded LFU keeps the labels seen on
+every request and lets one-off lines (prices, order numbers) go. Each
+worker process has its own cache. It serves the default engine only, so
+entries need no model tag.
+"""
+
+from __future__ import annotations
+
+import itertools
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+from app.config import settings
+from app.services.metrics import Counter
+
+# numpy / cv2 come with the OCR engine; imported on first use
+if TYPE_CHECKING:
+    import numpy as np
+
+# Rows of a signature; its width follows the inked aspect ratio
+SIGNATURE_HEIGHT = 16
+# Max mean absolute difference (0..1 ink scale) of any character-sized block
+MATCH_TOLERANCE = 0.05
+# Low-confidence reads are re-run rather than repeated from the cache
+MIN_CACHE_SCORE = 0.9
+
+
+def crop_signature(crop: np.ndarray) -> np.ndarray | None:
+    """(SIGNATURE_HEIGHT, W) float32 ink map of a BGR crop, None if blank."""
+    import cv2
+    import numpy as np
+
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    gray = gray.astype(np.float32)
+    lo, hi = np.percentile(gray, (2, 98))
+    if hi - lo < 1:
+        return None
+    ink = np.clip((gray - lo) / (hi - lo), 0, 1)
+    if ink.mean() > 0.5:  # dark text on light background -> ink is 1
+        ink = 1 - ink
+
+    # Trim the detector's padding, which differs from box to box
+    mask = ink > 0.5
+    rows, cols = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+    ink = ink[rows[0] : rows[-1] + 1, cols[0] : cols[-1] + 1]
+    h, w = ink.shape
+    width = max(1, round(w * SIGNATURE_HEIGHT / h))
+    return cv2.resize(ink, (width, SIGNATURE_HEIGHT), interpolation=cv2.INTER_AREA)
+
+
+def _matches(a: np.ndarray, b: np.ndarray) -> bool:
+    import cv2
+    import numpy as np
+
+    if b.shape[1] != a.shape[1]:
+        b = cv2.resize(b, (a.shape[1], SIGNATURE_HEIGHT), interpolation=cv2.INTER_AREA)
+    # Blocks about half a (CJK) character wide, so one changed digit shows
+    blocks = max(1, a.shape[1] // (SIGNATURE_HEIGHT // 2))
+    return all(d.mean() <= MATCH_TOLERANCE for d in np.array_split(np.abs(a - b), blocks, axis=1))
+
+
+@dataclass
+class _Entry:
+    signature: np.ndarray
+    result: Any  # (text, score) as returned by the rec model
+    hits: int = 1
+
+
+class RecognitionCache:
+    """Bounded LFU of crop signature -> (text, score); ties evict the least recent."""
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._entries: dict[int, _Entry] = {}
+        self._by_width: dict[int, list[int]] = {}
+        self._by_hits: dict[int, OrderedDict[int, None]] = {}
+        self._min_hits = 0
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def recognize(
+        self,
+        crops: Sequence[np.ndarray],
+        recognize: Callable[[list[Any]], tuple[list[Any], float]],
+    ) -> tuple[list[Any], float]:
+        """Same contract as `recognize(crops)`; only the cache misses reach it."""
+        signatures = [crop_signature(crop) for crop in crops]
+        results = [self.get(s) if s is not None else None for s in signatures]
+        missing = [i for i, r in enumerate(results) if r is None]
+        if not missing:
+            return results, 0.0
+
+        rec_res, elapse = recognize([crops[i] for i in missing])
+        for i, result in zip(missing, rec_res):
+            results[i] = result
+            signature = signatures[i]
+            if signature is not None and result[1] >= MIN_CACHE_SCORE:
+                self.put(signature, result)
+        return results, elapse
+
+    def get(self, signature: np.ndarray) -> Any | None:
+        with self._lock:
+            entry_id = self._find(signature)
+            if entry_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touch(entry_id)
+            return self._entries[entry_id].result
+
+    def put(self, signature: np.ndarray, result: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if self._find(signature) is not None:
+                return
+            if len(self._entries) >= self.max_entries:
+                self._evict()
+            entry_id = next(self._ids)
+            self._entries[entry_id] = _Entry(signature, result)
+            self._by_width.setdefault(signature.shape[1], []).append(entry_id)
+            self._by_hits.setdefault(1, OrderedDict())[entry_id] = None
+            self._min_hits = 1
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    # ─── internals (caller holds the lock) ───
+
+    def _find(self, signature: np.ndarray) -> int | None:
+        # Widths of one label vary by a column between screenshots
+        width = signature.shape[1]
+        for w in (width, width - 1, width + 1):
+            for entry_id in self._by_width.get(w, ()):
+                if _matches(signature, self._entries[entry_id].signature):
+                    return entry_id
+        return None
+
+    def _touch(self, entry_id: int) -> None:
+        """Move an entry to the next frequency bucket."""
+        entry = self._entries[entry_id]
+        bucket = self._by_hits[entry.hits]
+        del bucket[entry_id]
+        if not bucket:
+            del self._by_hits[entry.hits]
+            if self._min_hits == entry.hits:
+                self._min_hits += 1
+        entry.hits += 1
+        self._by_hits.setdefault(entry.hits, OrderedDict())[entry_id] = None
+
+    def _evict(self) -> None:
+        bucket = self._by_hits[self._min_hits]
+        entry_id, _ = bucket.popitem(last=False)
+        if not bucket:
+            del self._by_hits[self._min_hits]
+        entry = self._entries.pop(entry_id)
+        siblings = self._by_width[entry.signature.shape[1]]
+        siblings.remove(entry_id)
+        if not siblings:
+            del self._by_width[entry.signature.shape[1]]
+
+
+rec_cache = RecognitionCache(max_entries=settings.ocr_rec_cache_entries)
+
+Counter(
+    "ust_ocr_rec_cache_hits_total",
+    "Text-line crops whose recognition was served from the crop cache.",
+    callback=lambda: {(): rec_cache.hits},
+)
+Counter(
+    "ust_ocr_rec_cache_misses_total",
+    "Text-line crops that had to run the recognition model.",
+    callback=lambda: {(): rec_cache.misses},
+)
@@ -1,16 +1,27 @@
+from __future__ import annotations
+
 import re
-from difflib import SequenceMatcher
+import statistics
+from collections.abc import Iterable
+from operator import itemgetter
 from typing import Any
 
+from app.services.menu_catalog import ADDON_KINDS, MenuCatalog, get_catalog
+from app.services.metrics import STAGE_SECONDS
+from app.services.ocr_result import OCRResult
+from app.services.section_markers import SectionMatcher
 
 # ─── Bilingual section markers ───
+# Simplified-Chinese and OCR-misread forms are folded by the matcher
 SECTIONS: dict[str, list[str]] = {
     "order_num": ["Order #", "訂單號碼"],
     "restaurant": ["Serving restaurant", "提供服務的餐廳"],
     "summary": ["Order Summary", "訂單內容"],
-    "payment": ["Payment Details", "付款詳情"],
+    "payment": ["Payment Details", "付款詳情", "付款情"],
 }
 
+SECTION_MATCHER = SectionMatcher(SECTIONS)
+
 
 # =========================================================
 # HELPERS
@@ -25,47 +36,64 @@ def _extract_price(text: str) -> float:
     return 0.0
 
 
-def _contains_hkust(text: str) -> bool:
+def contains_hkust(text: str) -> bool:
     lower = text.lower()
     return "hong kong university of science" in lower or "hkust" in lower
 
 
-def _convert_ocr_entries(ocr_results: list[dict[str, Any]]) -> list[dict[str, Any]]:
-    """Convert OCR service format {text,bbox,height,confidence,avg_y,avg_x}
-    to parser entry format {text,x,y,h}."""
-    entries: list[dict[str, Any]] = []
-    for item in ocr_results:
-        text = item.get("text", "").strip()
-        if not text:
-            continue
-        entries.append(
-            {
-                "text": text,
-                "x": item.get("avg_x", 0.0),
-                "y": item.get("avg_y", 0.0),
-                "h": item.get("height", 0.0),
-            }
+def _convert_ocr_entries(ocr: OCRResult) -> list[dict[str, Any]]:
+    """Parser entries {text,x,y,h} for the non-empty boxes of one image.
+
+    OCRResult is already sorted by (y, x), so entries come out top to bottom."""
+    return [
+        {"text": text, "x": x, "y": y, "h": h}
+        for text, x, y, h in zip(
+            map(str.strip, ocr.texts),
+            ocr.centers_x.tolist(),
+            ocr.centers_y.tolist(),
+            ocr.heights.tolist(),
         )
-    return sorted(entries, key=lambda e: (e["y"], e["x"]))
+        if text
+    ]
 
 
 # =========================================================
 # Row clustering
 # =========================================================
 
+# A new row starts when y jumps by more than this fraction of the median
+# glyph height, so the threshold follows image scale and device density
+ROW_GAP_HEIGHT_RATIO = 1 / 3
+# Gap used when boxes carry no height
+DEFAULT_ROW_GAP = 15.0
+
+
+def row_gap(heights: Iterable[float]) -> float:
+    """Row break threshold in pixels derived from the box heights."""
+    heights = [h for h in heights if h > 0]
+    if not heights:
+        return DEFAULT_ROW_GAP
+    return statistics.median(heights) * ROW_GAP_HEIGHT_RATIO
+
 
-def cluster_rows(entries: list[dict[str, Any]], y_gap: float = 15) -> list[list[dict[str, Any]]]:
-    """Group entries into rows by vertical proximity."""
+def cluster_rows(entries: list[dict[str, Any]], y_gap: float | None = None) -> list[list[dict[str, Any]]]:
+    """Group y-sorted entries into rows by vertical proximity, each row
+    ordered left to right. `y_gap` defaults to `row_gap` of the boxes.
+
+    A plain loop: at receipt sizes (tens to hundreds of boxes) building
+    arrays from the entry dicts costs more than it saves."""
     if not entries:
         return []
+    gap = row_gap(map(itemgetter("h"), entries)) if y_gap is None else y_gap
+    by_x = itemgetter("x")
     rows: list[list[dict[str, Any]]] = []
     cur = [entries[0]]
-    for e in entries[1:]:
-        if e["y"] - cur[-1]["y"] > y_gap:
-            rows.append(sorted(cur, key=lambda e: e["x"]))
+    for prev, e in zip(entries, entries[1:]):
+        if e["y"] - prev["y"] > gap:
+            rows.append(sorted(cur, key=by_x))
             cur = []
         cur.append(e)
-    rows.append(sorted(cur, key=lambda e: e["x"]))
+    rows.append(sorted(cur, key=by_x))
     return rows
 
 
@@ -78,36 +106,145 @@ def row_text(row: list[dict[str, Any]]) -> str:
 # =========================================================
 
 
-def merge_screenshots(entries_list: list[list[dict[str, Any]]]) -> list[dict[str, Any]]:
+# Rows of the merged tail / new head considered for the overlap
+_OVERLAP_WINDOW = 40
+# Head rows of a new screenshot that may precede the overlap (status bar, app header)
+_MAX_HEAD_SKIP = 3
+# Tail rows of the previous screenshot that may be cut off at its bottom edge
+_MAX_TAIL_SKIP = 2
+# Shingle (character bigram) similarity for rows that differ only by OCR noise
+_FUZZY_ROW_SIMILARITY = 0.5
+# Consecutive similar rows a fuzzy overlap needs; one row is too weak an
+# anchor ("Total HK$ 43.00" is similar to "Subtotal HK$ 43.00")
+_MIN_FUZZY_RUN = 2
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def fingerprint(text: str) -> str:
+    """Text reduced to lowercase letters and digits, so the same line read
+    twice with different spacing or punctuation compares equal."""
+    return _NON_WORD.sub("", text.lower())
+
+
+def _row_fingerprint(row: list[dict[str, Any]]) -> str:
+    return fingerprint(row_text(row))
+
+
+def _shingles(fingerprint: str) -> tuple[str, frozenset[int]]:
+    """Digits of a fingerprint and its hashed character bigrams."""
+    digits = "".join(c for c in fingerprint if c.isdigit())
+    if len(fingerprint) < 2:
+        return digits, frozenset([hash(fingerprint)])
+    return digits, frozenset(hash(fingerprint[i : i + 2]) for i in range(len(fingerprint) - 1))
+
+
+def _similar(a: tuple[str, frozenset[int]], b: tuple[str, frozenset[int]]) -> bool:
+    # OCR noise blurs letters; a different price or quantity is another row
+    return a[0] == b[0] and len(a[1] & b[1]) >= _FUZZY_ROW_SIMILARITY * len(a[1] | b[1])
+
+
+def _suffix_prefix_overlap(tail: list[str], head: list[str]) -> int:
+    """Longest k with tail[-k:] == head[:k], by the KMP failure function
+    over head + separator + tail (linear in their lengths)."""
+    seq: list[str | None] = [*head, None, *tail]
+    fail = [0] * len(seq)
+    for i in range(1, len(seq)):
+        k = fail[i - 1]
+        while k and seq[i] != seq[k]:
+            k = fail[k - 1]
+        if seq[i] == seq[k]:
+            k += 1
+        fail[i] = k
+    return fail[-1]
+
+
+def find_overlap(merged_fps: list[str], new_fps: list[str]) -> int:
+    """Number of leading rows of a new screenshot already at the end of the
+    merged ones, given the `fingerprint` of every row. Only the last and
+    first _OVERLAP_WINDOW rows are compared.
+
+    Exact alignment first: the longest suffix of the tail equal to a prefix
+    of the head, allowing a few chrome rows before it in the head and a
+    few cut-off rows after it in the tail. Unless the whole tail aligned
+    exactly, shingle similarity is tried too, anchored on where a last
+    tail row reappears near the top of the head and backed by the row
+    before it; rows only match with the same digits. The longer overlap wins.
+    """
+    tail_fps, head_fps = merged_fps[-_OVERLAP_WINDOW:], new_fps[:_OVERLAP_WINDOW]
+    if not tail_fps or not head_fps:
+        return 0
+    # Fewest skipped rows first: repetitive receipts (the same add-ons under
+    # several meals) can align longer, but wrongly, with more rows skipped
+    shifts = sorted(
+        ((trim, skip) for trim in range(min(_MAX_TAIL_SKIP, len(tail_fps) - 1) + 1)
+         for skip in range(min(_MAX_HEAD_SKIP, len(head_fps) - 1) + 1)),
+        key=sum,
+    )
+    best_end, best_trim = 0, 0
+    for trim, skip in shifts:
+        k = _suffix_prefix_overlap(tail_fps[: len(tail_fps) - trim], head_fps[skip:])
+        if k:
+            best_end, best_trim = skip + k, trim
+            break
+    if best_end and best_trim == 0:
+        return best_end
+
+    tail_sh = [_shingles(fp) for fp in tail_fps]
+    head_sh = [_shingles(fp) for fp in head_fps]
+    for trim in range(min(_MAX_TAIL_SKIP, len(tail_sh) - 1) + 1):
+        last = len(tail_sh) - 1 - trim
+        for end in range(len(head_sh) - 1, -1, -1):
+            if not _similar(head_sh[end], tail_sh[last]):
+                continue
+            # Walk back from the anchor while rows keep matching
+            n = 1
+            while n <= end and n <= last and _similar(head_sh[end - n], tail_sh[last - n]):
+                n += 1
+            if n >= _MIN_FUZZY_RUN and end - n < _MAX_HEAD_SKIP:
+                return max(best_end, end + 1)
+    return best_end
+
+
+def merge_screenshots(
+    entries_list: list[list[dict[str, Any]]], aligned: list[bool] | None = None
+) -> list[dict[str, Any]]:
     """
     Merge multiple screenshot OCR results.
     Detects overlap between tail of image N and head of image N+1,
     deduplicates, then concatenates.
+
+    Rows are compared by normalized fingerprints, computed once per row,
+    and only the head of each new image is aligned against the merged
+    tail, so merging stays linear in the number of rows.
+
+    `aligned[i]` marks an image already cropped below what image i-1
+    showed (`plan_screenshots`); it is appended without text alignment.
     """
     if len(entries_list) <= 1:
         return entries_list[0] if entries_list else []
 
     merged_rows = cluster_rows(entries_list[0])
+    merged_fps = [_row_fingerprint(r) for r in merged_rows]
+    y_max = max((e["y"] for e in entries_list[0]), default=0)
 
-    for entries in entries_list[1:]:
+    for i, entries in enumerate(entries_list[1:], start=1):
         new_rows = cluster_rows(entries)
+        if not new_rows:
+            continue
+        new_fps = [_row_fingerprint(r) for r in new_rows]
 
         # compare tail of merged vs head of new to find overlap
-        tail_texts = [row_text(r).lower() for r in merged_rows[-8:]]
-        overlap_end = 0
-
-        for i, nr in enumerate(new_rows):
-            nt = row_text(nr).lower()
-            for tt in tail_texts:
-                if SequenceMatcher(None, nt, tt).ratio() > 0.75:
-                    overlap_end = i + 1  # skip this row (it's a duplicate)
-                    break
+        overlap_end = 0 if aligned and aligned[i] else find_overlap(merged_fps, new_fps)
 
         # append non-overlapping rows with a y-offset so ordering is preserved
-        y_offset = max(e["y"] for r in merged_rows for e in r) + 100
+        y_offset = y_max + 100
 
-        for row in new_rows[overlap_end:]:
-            merged_rows.append([{**e, "y": e["y"] + y_offset} for e in row])
+        for row, fp in zip(new_rows[overlap_end:], new_fps[overlap_end:]):
+            shifted = [{**e, "y": e["y"] + y_offset} for e in row]
+            merged_rows.append(shifted)
+            merged_fps.append(fp)
+            y_max = max(y_max, max(e["y"] for e in shifted))
 
     return [e for row in merged_rows for e in row]
 
@@ -121,10 +258,8 @@ def find_sections(rows: list[list[dict[str, Any]]]) -> dict[str, int]:
     """Return {section_name: row_index} for each detected section marker."""
     idx: dict[str, int] = {}
     for i, row in enumerate(rows):
-        t = row_text(row).lower()
-        for name, keywords in SECTIONS.items():
-            if any(kw.lower() in t for kw in keywords):
-                idx[name] = i
+        for name in SECTION_MATCHER.sections(row_text(row)):
+            idx[name] = i
     return idx
 
 
@@ -163,7 +298,7 @@ def parse_restaurant(rows: list[list[dict[str, Any]]], sec_idx: dict[str, int])
     for row in rows[start:end]:
         t = row_text(row)
         # stop if we accidentally hit another marker
-        if any(any(kw.lower() in t.lower() for kw in kws) for kws in SECTIONS.values()):
+        if SECTION_MATCHER.is_marker(t):
             break
         parts.append(t)
     return " ".join(parts).strip()
@@ -186,14 +321,33 @@ def has_qty_on_right(row: list[dict[str, Any]], x_gap: float = 40) -> tuple[bool
     return False, None
 
 
-def parse_items(rows: list[list[dict[str, Any]]], sec_idx: dict[str, int]) -> list[dict[str, Any]]:
+def _new_item(name: str, qty: int, catalog: MenuCatalog) -> dict[str, Any]:
+    """Item under its catalog name when the name is on the menu, priced
+    when the catalog lists a price (0.0: unknown)."""
+    match = catalog.match(name)
+    if match is None:
+        return {"name": name, "quantity": qty, "price": 0.0}
+    return {"name": match.name, "quantity": qty, "price": match.entry.price or 0.0}
+
+
+def parse_items(
+    rows: list[list[dict[str, Any]]],
+    sec_idx: dict[str, int],
+    catalog: MenuCatalog | None = None,
+) -> list[dict[str, Any]]:
     """
     Between "Order Summary" and "Payment Details":
       - row with qty number on far right  →  new item (name = rest of row)
       - row without qty                   →  detail of current item
+
+    Item names are canonicalized against the menu catalog, and priced
+    where it has prices; detail rows that are priced add-ons raise the
+    unit price of their item.
     """
     if "summary" not in sec_idx:
         return []
+    if catalog is None:
+        catalog = get_catalog()
     start = sec_idx["summary"] + 1
     end = next_section_idx(sec_idx, sec_idx["summary"], len(rows))
 
@@ -203,7 +357,7 @@ def parse_items(rows: list[list[dict[str, Any]]], sec_idx: dict[str, int]) -> li
     for row in rows[start:end]:
         t = row_text(row)
         # stop if we hit another section marker
-        if any(any(kw.lower() in t.lower() for kw in kws) for kws in SECTIONS.values()):
+        if SECTION_MATCHER.is_marker(t):
             break
 
         found_qty, qty = has_qty_on_right(row)
@@ -214,15 +368,17 @@ def parse_items(rows: list[list[dict[str, Any]]], sec_idx: dict[str, int]) -> li
                 items.append(current)
             rightmost = max(row, key=lambda e: e["x"])
             name = " ".join(e["text"] for e in row if e is not rightmost)
-            current = {"name": name, "quantity": qty, "price": 0.0}
+            current = _new_item(name, qty, catalog)
 
         elif current is not None:
-            # detail line of current item (not in schema, skip)
-            pass
+            # detail line of current item: only priced add-ons matter (for the price)
+            addon = catalog.match(t, kinds=ADDON_KINDS)
+            if addon is not None and addon.entry.price and current["price"]:
+                current["price"] += addon.entry.price
 
         else:
             # edge case: item without detected qty
-            current = {"name": t, "quantity": 1, "price": 0.0}
+            current = _new_item(t, 1, catalog)
 
     if current:
         items.append(current)
@@ -251,13 +407,35 @@ def parse_payment(
 # =========================================================
 
 
-def parse_mcd_app_receipt(ocr_results_per_image: list[list[dict[str, Any]]]) -> dict[str, Any]:
+def validate_totals(items: list[dict[str, Any]], subtotal: float, total: float) -> list[str]:
+    """Consistency errors between the parsed items, subtotal and total."""
+    errors: list[str] = []
+
+    if not items:
+        errors.append("No items detected")
+
+    # Only a fully priced order can be checked against the subtotal
+    computed_sum = sum(i["price"] * i["quantity"] for i in items)
+    all_priced = all(i["price"] for i in items)
+    if subtotal and computed_sum and all_priced and abs(computed_sum - subtotal) > 1.0:
+        errors.append("Subtotal mismatch")
+
+    if subtotal and total and abs(subtotal - total) > 1.0:
+        errors.append("Subtotal/Total mismatch")
+
+    return errors
+
+
+def parse_mcd_app_receipt(
+    ocr_results_per_image: list[OCRResult], aligned: list[bool] | None = None
+) -> dict[str, Any]:
     """
     Parse McDonald's app receipt from OCR results.
 
     Args:
-        ocr_results_per_image: list of per-image OCR results,
-            each a list of dicts with {text, bbox, height, confidence, avg_y, avg_x}
+        ocr_results_per_image: one OCRResult per screenshot, in scroll order
+        aligned: per screenshot, whether it was cropped to start below the
+            previous one before OCR (see `merge_screenshots`)
 
     Returns:
         dict with order_number, restaurant, is_valid, items, subtotal, total, errors
@@ -277,36 +455,29 @@ def parse_mcd_app_receipt(ocr_results_per_image: list[list[dict[str, Any]]]) ->
     entries_list = [_convert_ocr_entries(results) for results in ocr_results_per_image]
 
     # 2. Merge multi-screenshot (handles overlap dedup)
-    entries = merge_screenshots(entries_list)
+    with STAGE_SECONDS.time(stage="merge_screenshots"):
+        entries = merge_screenshots(entries_list, aligned)
 
     # 3. Cluster into rows
-    rows = cluster_rows(entries)
+    with STAGE_SECONDS.time(stage="cluster_rows"):
+        rows = cluster_rows(entries)
 
-    # 4. Find section boundaries
-    sec_idx = find_sections(rows)
+    with STAGE_SECONDS.time(stage="section_parsing"):
+        # 4. Find section boundaries
+        sec_idx = find_sections(rows)
 
-    # 5. Parse each section
-    order_number = parse_order_number(rows, sec_idx)
-    restaurant = parse_restaurant(rows, sec_idx)
-    items = parse_items(rows, sec_idx)
-    subtotal, total = parse_payment(rows, sec_idx)
+        # 5. Parse each section
+        order_number = parse_order_number(rows, sec_idx)
+        restaurant = parse_restaurant(rows, sec_idx)
+        items = parse_items(rows, sec_idx)
+        subtotal, total = parse_payment(rows, sec_idx)
 
     # 6. HKUST validation
     full_text = " ".join(row_text(r) for r in rows)
-    is_valid = _contains_hkust(full_text)
+    is_valid = contains_hkust(full_text)
 
     # 7. Validation errors
-    errors: list[str] = []
-
-    if not items:
-        errors.append("No items detected")
-
-    computed_sum = sum(i["price"] * i["quantity"] for i in items)
-    if subtotal and computed_sum and abs(computed_sum - subtotal) > 1.0:
-        errors.append("Subtotal mismatch")
-
-    if subtotal and total and abs(subtotal - total) > 1.0:
-        errors.append("Subtotal/Total mismatch")
+    errors = validate_totals(items, subtotal, total)
 
     is_valid = is_valid and len(errors) == 0
 
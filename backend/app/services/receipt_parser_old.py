@@ -1,5 +1,6 @@
 import re
 
+from app.services.section_markers import SectionMatcher
 
 # Section markers in McDonald's receipts (including OCR-mangled variants)
 _SECTION_MARKERS = [
@@ -7,10 +8,12 @@ _SECTION_MARKERS = [
     "payment details", "subtotal", "total",
     "訂單詳情", "提供服務的餐廳", "訂單摘要", "訂單內容",
     "付款詳情", "合計", "總計",
-    # OCR-mangled variants
-    "订罩", "付款情", "訂罩",
+    # OCR-mangled variants ("訂罩內容" etc. fold onto the 訂單 markers above)
+    "付款情",
 ]
 
+_SECTION_MATCHER = SectionMatcher({"marker": _SECTION_MARKERS})
+
 _HKUST_KEYWORDS = [
     "HKUST",
     "Hong Kong University of Science",
@@ -32,8 +35,7 @@ def _extract_price(text: str) -> float | None:
 
 def _is_section_marker(line: str) -> bool:
     """Check if a line is a known section marker."""
-    lower = line.strip().lower()
-    return any(marker in lower for marker in _SECTION_MARKERS)
+    return _SECTION_MATCHER.is_marker(line.strip())
 
 
 def parse_receipt(text_lines: list[str]) -> dict:
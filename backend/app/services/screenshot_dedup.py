@@ -0,0 +1,180 @@
+"""Pixel-level duplicate and overlap removal for multi-screenshot uploads.
+
+Users capture one long receipt as several screenshots, scrolling a little
+between them, so most of each screenshot was already in the previous one.
+Before OCR, every accepted image is reduced to a grayscale row profile
+(each pixel row averaged into PROFILE_COLUMNS cells) and a difference hash:
+
+- an image whose hash is within DUPLICATE_MAX_BITS of an earlier one (and,
+  for equal sizes, whose rows match it in place) is dropped;
+- consecutive images of the same size are registered by voting on the
+  vertical shift between rows with equal quantized profiles, verifying the
+  best shifts row by row. The next image is then OCR'd only below the band
+  it shares with the previous one, snapped up to a blank row so no text
+  line is cut.
+
+Status bar and sticky title rows stay in place while the page scrolls, so
+they fall inside the cropped band too. `merge_screenshots` appends the
+text of a cropped upload as is and aligns only the uploads this stage
+could not register: the few rows left of a crop are no text anchor.
+"""
+
+from __future__ import annotations
+
+import io
+import logging
+from collections import Counter as Tally
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from app.services.metrics import Counter
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PROFILE_COLUMNS = 64
+# Rows whose profile cells differ by at most this much (mean, 0-255) match;
+# absorbs JPEG noise, not a changed glyph
+ROW_TOLERANCE = 6.0
+# A row with this little contrast across its cells is background
+BLANK_RANGE = 6
+# 16 x 16 difference hash
+HASH_SIZE = 16
+DUPLICATE_MAX_BITS = 6
+# Fraction of text rows that must match for a duplicate / a registration
+MIN_MATCHING_FRACTION = 0.9
+# Shifts tried, by vote count; an overlap needs this many matching text rows
+CANDIDATE_SHIFTS = 3
+MIN_OVERLAP_TEXT_ROWS = 40
+
+SCREENSHOT_DEDUP = Counter(
+    "ust_screenshot_dedup_total",
+    "Multi-screenshot uploads dropped as duplicates or cropped to their unseen band.",
+    ("outcome",),
+)
+
+
+@dataclass
+class ScreenshotPlan:
+    """What to OCR of one upload: rows from `top` down (original pixels),
+    or nothing when it duplicates upload `duplicate_of`."""
+
+    top: int = 0
+    duplicate_of: int | None = None
+
+
+@dataclass
+class _Screenshot:
+    size: tuple[int, int]
+    dhash: int
+    profile: np.ndarray  # (H, PROFILE_COLUMNS) float32
+    text_rows: np.ndarray  # (H,) bool: rows that are not background
+
+
+def _load(image_bytes: bytes) -> _Screenshot | None:
+    import numpy as np
+    from PIL import Image
+
+    try:
+        image = Image.open(io.BytesIO(image_bytes)).convert("L")
+    except Exception:
+        return None  # OCR reports the decode error
+    width, height = image.size
+    profile = np.asarray(image.resize((PROFILE_COLUMNS, height), Image.Resampling.BOX), dtype=np.float32)
+    small = np.asarray(image.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return _Screenshot(
+        size=(width, height),
+        dhash=int.from_bytes(np.packbits(bits).tobytes(), "big"),
+        profile=profile,
+        text_rows=np.ptp(profile, axis=1) > BLANK_RANGE,
+    )
+
+
+def _rows_match(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return abs(a - b).mean(axis=1) <= ROW_TOLERANCE
+
+
+def _is_duplicate(prev: _Screenshot, new: _Screenshot) -> bool:
+    if (prev.dhash ^ new.dhash).bit_count() > DUPLICATE_MAX_BITS:
+        return False
+    if prev.size != new.size:
+        return True  # a resized or re-encoded copy
+    # A short scroll barely changes the hash; only an in-place match is a duplicate
+    text = new.text_rows | prev.text_rows
+    if not text.any():
+        return True
+    return bool(_rows_match(prev.profile, new.profile)[text].mean() >= MIN_MATCHING_FRACTION)
+
+
+def _vote_shifts(prev: _Screenshot, new: _Screenshot) -> list[int]:
+    """Downward scroll distances suggested by rows with equal quantized profiles."""
+    import numpy as np
+
+    def keys(shot: _Screenshot) -> dict[bytes, list[int]]:
+        rows: dict[bytes, list[int]] = {}
+        quantized = (shot.profile // 16).astype(np.uint8)
+        for r in np.flatnonzero(shot.text_rows).tolist():
+            rows.setdefault(quantized[r].tobytes(), []).append(r)
+        return rows
+
+    prev_rows = keys(prev)
+    votes: Tally[int] = Tally()
+    for key, rows in keys(new).items():
+        seen = prev_rows.get(key, [])
+        # Rows repeated all over the page (separators) say nothing
+        if len(seen) * len(rows) > 16:
+            continue
+        votes.update(p - r for p in seen for r in rows if p > r)
+    return [shift for shift, _ in votes.most_common(CANDIDATE_SHIFTS)]
+
+
+def _overlap_top(prev: _Screenshot, new: _Screenshot) -> int:
+    """First row of `new` not already shown by `prev` (0 if not registered)."""
+    import numpy as np
+
+    height = new.size[1]
+    for shift in _vote_shifts(prev, new):
+        # new row r shows what prev showed at row r + shift
+        ok = _rows_match(new.profile[: height - shift], prev.profile[shift:])
+        text = new.text_rows[: height - shift]
+        matched = np.flatnonzero(ok & text)
+        if matched.size < MIN_OVERLAP_TEXT_ROWS:
+            continue
+        # Fixed title / bottom bars sit outside the matched span and never match
+        first, last = int(matched[0]), int(matched[-1])
+        if ok[first : last + 1][text[first : last + 1]].mean() < MIN_MATCHING_FRACTION:
+            continue
+        # From the first text row that differs on, prev showed something else
+        # (its bottom bar, which may itself match under a short scroll); back
+        # up to a blank row so a half-seen line is kept whole
+        differs = np.flatnonzero(text[first:] & ~ok[first:])
+        top = first + int(differs[0]) if differs.size else height - shift
+        blank = np.flatnonzero(~new.text_rows[:top])
+        return int(blank[-1]) if blank.size else 0
+    return 0
+
+
+def plan_screenshots(images: list[bytes]) -> list[ScreenshotPlan]:
+    """Decide, per image in upload order, what still needs OCR."""
+    shots = [_load(image_bytes) for image_bytes in images]
+    plans = [ScreenshotPlan() for _ in images]
+    previous: _Screenshot | None = None
+    for i, shot in enumerate(shots):
+        if shot is None:
+            continue
+        earlier = (j for j in range(i) if shots[j] is not None and plans[j].duplicate_of is None)
+        duplicate_of = next((j for j in earlier if _is_duplicate(shots[j], shot)), None)
+        if duplicate_of is not None:
+            plans[i].duplicate_of = duplicate_of
+            SCREENSHOT_DEDUP.inc(outcome="duplicate")
+            continue
+        if previous is not None and previous.size == shot.size:
+            plans[i].top = _overlap_top(previous, shot)
+            if plans[i].top:
+                SCREENSHOT_DEDUP.inc(outcome="cropped")
+                logger.debug(f"Screenshot {i}: rows above {plans[i].top} already seen")
+        previous = shot
+    return plans
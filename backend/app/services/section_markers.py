@@ -0,0 +1,73 @@
+"""Compiled matcher for receipt section markers.
+
+All markers of all sections are folded into one alternation regex, built
+once, so a row is classified in a single scan instead of one substring
+test per keyword. Rows and markers go through the same normalization:
+NFKC (full-width forms), lowercase, and a character fold that maps
+simplified Chinese and common OCR misreads onto the traditional forms
+the McDonald's app prints.
+"""
+
+import re
+import unicodedata
+
+# Simplified → traditional for the characters used in section markers and
+# menu item names, plus OCR confusions seen on real screenshots (單 read as 罩)
+_FOLD = {
+    "订": "訂",
+    "单": "單",
+    "罩": "單",
+    "号": "號",
+    "码": "碼",
+    "详": "詳",
+    "内": "內",
+    "务": "務",
+    "厅": "廳",
+    "计": "計",
+    "总": "總",
+    "无": "無",
+    "麦": "麥",
+    "鸡": "雞",
+    "鱼": "魚",
+    "乐": "樂",
+    "条": "條",
+    "饼": "餅",
+    "猪": "豬",
+    "汉": "漢",
+    "层": "層",
+    "双": "雙",
+    "苹": "蘋",
+    "风": "風",
+    "细": "細",
+}
+_FOLD_CHARS = re.compile(f"[{''.join(_FOLD)}]")
+
+
+def normalize(text: str) -> str:
+    """Fold text for marker matching (case, width, script variant)."""
+    if text.isascii():
+        return text.lower()
+    text = unicodedata.normalize("NFKC", text).lower()
+    # str.translate walks every character; most rows contain none of these
+    return _FOLD_CHARS.sub(lambda m: _FOLD[m.group()], text)
+
+
+class SectionMatcher:
+    """Classify text against {section: [markers]} in one regex pass."""
+
+    def __init__(self, markers: dict[str, list[str]]) -> None:
+        self._section_of: dict[str, str] = {}
+        for section, keywords in markers.items():
+            for kw in keywords:
+                self._section_of.setdefault(normalize(kw), section)
+        # Longest first, so "subtotal" wins over "total" at the same position
+        alternatives = sorted(self._section_of, key=len, reverse=True)
+        self._pattern = re.compile("|".join(re.escape(kw) for kw in alternatives))
+
+    def sections(self, text: str) -> list[str]:
+        """Sections whose markers occur in `text`, in order of appearance."""
+        found = [self._section_of[m.group(0)] for m in self._pattern.finditer(normalize(text))]
+        return list(dict.fromkeys(found))
+
+    def is_marker(self, text: str) -> bool:
+        return self._pattern.search(normalize(text)) is not None
@@ -0,0 +1,132 @@
+"""Fixed-size pool of model instances behind a fair FIFO queue.
+
+llama.cpp contexts are not safe for concurrent use, so each request
+borrows one instance exclusively. Instances are created lazily up to
+`size`; callers beyond that wait in strict arrival order and can give up
+via a timeout or a cancellation event.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Generic, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# How often a waiter with a cancel event checks it
+_CANCEL_POLL_SECONDS = 0.05
+
+
+class PoolTimeoutError(TimeoutError):
+    """No instance became free within the caller's timeout."""
+
+
+class PoolCancelledError(Exception):
+    """The caller cancelled while waiting for an instance."""
+
+
+class _Waiter(Generic[T]):
+    __slots__ = ("event", "instance")
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.instance: T | None = None
+
+
+class ModelPool(Generic[T]):
+    def __init__(self, factory: Callable[[], T], size: int) -> None:
+        self._factory = factory
+        self.size = size
+
+        self._lock = threading.Lock()
+        self._idle: list[T] = []
+        self._waiters: deque[_Waiter[T]] = deque()
+        self._created = 0
+
+    @contextmanager
+    def acquire(
+        self,
+        timeout: float | None = None,
+        cancel: threading.Event | None = None,
+    ) -> Iterator[T]:
+        """Borrow an instance for the duration of the `with` block."""
+        instance = self._get(timeout, cancel)
+        try:
+            yield instance
+        finally:
+            self._release(instance)
+
+    def waiting(self) -> int:
+        with self._lock:
+            return len(self._waiters)
+
+    def warm(self) -> None:
+        """Create every instance now instead of on first use."""
+        while True:
+            with self._lock:
+                if self._created >= self.size:
+                    return
+                self._created += 1
+            self._release(self._create())
+
+    # ─── internals ───
+
+    def _create(self) -> T:
+        try:
+            return self._factory()
+        except BaseException:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _get(self, timeout: float | None, cancel: threading.Event | None) -> T:
+        with self._lock:
+            # Only take an idle instance if nobody is queued ahead of us
+            if self._idle and not self._waiters:
+                return self._idle.pop()
+            create = self._created < self.size
+            if create:
+                self._created += 1
+            else:
+                waiter: _Waiter[T] = _Waiter()
+                self._waiters.append(waiter)
+
+        if create:
+            return self._create()
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            wait = remaining
+            if cancel is not None:
+                wait = _CANCEL_POLL_SECONDS if remaining is None else min(remaining, _CANCEL_POLL_SECONDS)
+            if waiter.event.wait(wait):
+                assert waiter.instance is not None
+                return waiter.instance
+
+            cancelled = cancel is not None and cancel.is_set()
+            timed_out = deadline is not None and time.monotonic() >= deadline
+            if not (cancelled or timed_out):
+                continue
+            with self._lock:
+                if waiter.instance is not None:
+                    # Handed an instance just as we gave up; keep it
+                    return waiter.instance
+                self._waiters.remove(waiter)
+            if cancelled:
+                raise PoolCancelledError("Cancelled while waiting for a model instance")
+            raise PoolTimeoutError(f"No model instance free within {timeout:.1f}s")
+
+    def _release(self, instance: T) -> None:
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.instance = instance
+                waiter.event.set()
+            else:
+                self._idle.append(instance)
@@ -1,180 +1,464 @@
+from __future__ import annotations
+
+import asyncio
 import base64
 import io
 import json
 import logging
-from typing import Any
+import re
+import threading
+import time
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, TypeVar
+
+from app.config import settings
+from app.services.metrics import STAGE_SECONDS, Gauge
+from app.services.vlm_pool import ModelPool
 
-from llama_cpp import Llama
-from llama_cpp.llama_chat_format import Llava15ChatHandler
+# llama_cpp is imported when the first context is created, not at app import
+if TYPE_CHECKING:
+    from llama_cpp import Llama
+    from PIL import Image
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Singleton - load once
-_model: Llama | None = None
+T = TypeVar("T")
+
+_HKUST_KEYWORDS = ["hkust", "hong kong university of science", "科技大學", "科技大学"]
+
+# Prompt for structured JSON output. Extraction and the HKUST check share
+# one generation so the image is encoded and prefilled only once.
+_EXTRACTION_PROMPT = """Extract structured data from this McDonald's receipt.
+Return ONLY valid JSON with this exact structure:
+{
+  "order_number": "string (order ID from receipt)",
+  "restaurant": "string (serving restaurant name)",
+  "mentions_hkust": true,
+  "items": [
+    {"name": "string", "quantity": 1, "price": 0.0}
+  ],
+  "subtotal": 0.0,
+  "total": 0.0
+}
+
+CRITICAL RULES:
+- mentions_hkust is true only if the receipt mentions HKUST, Hong Kong University of Science and Technology, or 科技大學
+- Meals with add-ons (e.g., "Chicken McNuggets Meal w Filet-O-Fish") are ONE item
+- Do NOT split meals into separate items
+- Extract exact prices from receipt (HK$ currency)
+- Return ONLY JSON, no other text
+"""
+
+_RECEIPT_SCHEMA: dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "order_number": {"type": "string"},
+        "restaurant": {"type": "string"},
+        "mentions_hkust": {"type": "boolean"},
+        "items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "quantity": {"type": "integer"},
+                    "price": {"type": "number"},
+                },
+                "required": ["name", "quantity", "price"],
+            },
+        },
+        "subtotal": {"type": "number"},
+        "total": {"type": "number"},
+    },
+    "required": ["order_number", "restaurant", "mentions_hkust", "items", "subtotal", "total"],
+}
 
 
-def _load_model() -> Llama:
+def _create_model() -> Llama:
     """
-    Load the SmolVLM model as a singleton.
-    Uses lazy loading on first request.
+    Load one SmolVLM context.
+    Every pool instance maps the same GGUF file, so the weights are shared
+    through the page cache; only the KV cache and CLIP state are per instance.
     """
-    global _model
-    if _model is None:
-        model_path = "models/SmolVLM2-2.2B-Instruct-Q4_K_M.gguf"
-        mmproj_path = "models/mmproj-SmolVLM2-2.2B-Instruct-Q8_0.gguf"
-
-        logger.info(f"Loading VLM model from {model_path}...")
-
-        # Initialize chat handler for multimodal support
-        # Note: SmolVLM typically uses LLaVA-style architecture compatible with standard handlers
-        # We use Llava15ChatHandler as a safe default for modern GGUF vision models
-        chat_handler = Llava15ChatHandler(clip_model_path=mmproj_path)
-
-        _model = Llama(
-            model_path=model_path,
-            chat_handler=chat_handler,
-            n_ctx=8192,  # Context for image embeddings
-            n_gpu_layers=0,  # CPU-only (target: ≤1.4s per image)
-            verbose=False,
-        )
-        logger.info("VLM model loaded successfully.")
+    from llama_cpp import Llama
+    from llama_cpp.llama_chat_format import Llava15ChatHandler
+
+    logger.info(f"Loading VLM model from {settings.vlm_model_path}...")
+
+    # Initialize chat handler for multimodal support
+    # Note: SmolVLM typically uses LLaVA-style architecture compatible with standard handlers
+    # We use Llava15ChatHandler as a safe default for modern GGUF vision models
+    chat_handler = Llava15ChatHandler(clip_model_path=settings.vlm_mmproj_path)
+
+    model = Llama(
+        model_path=settings.vlm_model_path,
+        chat_handler=chat_handler,
+        n_ctx=8192,  # Context for image embeddings
+        n_gpu_layers=0,  # CPU-only (target: ≤1.4s per image)
+        n_threads=settings.vlm_threads,
+        n_threads_batch=settings.vlm_threads,
+        use_mmap=True,
+        verbose=False,
+    )
+    logger.info("VLM model loaded successfully.")
+    return model
 
-    return _model
 
+# Pool of contexts, created lazily; requests queue fairly for a free one
+_pool: ModelPool[Llama] = ModelPool(_create_model, size=settings.vlm_pool_size)
 
-def _image_bytes_to_base64_uri(image_bytes: bytes) -> str:
+Gauge(
+    "ust_vlm_queue_waiting",
+    "VLM requests waiting for a free model instance.",
+    callback=lambda: {(): _pool.waiting()},
+)
+
+# Threads that may wait in the pool's queue on top of the running contexts
+_EXECUTOR_WAITERS = 16
+
+# A VLM call holds its thread for the whole generation, so it gets its own
+# threads rather than the default executor behind asyncio.to_thread. Calls
+# beyond these threads queue without VLM_QUEUE_TIMEOUT_SECONDS applying.
+_executor = ThreadPoolExecutor(max_workers=settings.vlm_pool_size + _EXECUTOR_WAITERS, thread_name_prefix="vlm")
+
+
+async def run_in_vlm_executor(fn: Callable[..., T], *args: Any) -> T:
+    """Run `fn(*args)` on the VLM threads without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, fn, *args)
+
+
+def shutdown_executor() -> None:
+    """Drop queued VLM calls; running generations finish in the background."""
+    _executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _image_bytes_to_base64_uri(image_bytes: bytes, mime: str = "image/jpeg") -> str:
     """Convert image bytes to base64 data URI for llama.cpp."""
     base64_data = base64.b64encode(image_bytes).decode("utf-8")
-    return f"data:image/jpeg;base64,{base64_data}"
+    return f"data:{mime};base64,{base64_data}"
 
 
-def _check_hkust_validation(image_bytes: bytes) -> bool:
-    """
-    Check if receipt is from HKUST McDonald's using VLM.
-    Looks for keywords: HKUST, Hong Kong University of Science and Technology, 科技大學.
+# ─── Image preprocessing ───
+
+# Ink blocks confined to these edges of a screenshot are phone chrome
+# (status bar, home indicator), not receipt content
+_STATUS_BAR_FRACTION = 0.08
+_HOME_BAR_FRACTION = 0.05
+# Grey-level distance from the background that counts as ink
+_INK_THRESHOLD = 40
+# Width of the thumbnail the content box is searched on
+_CROP_PROBE_WIDTH = 256
+
+
+def _receipt_bbox(image: Image.Image) -> tuple[int, int, int, int] | None:
+    """Bounding box of the receipt content, without phone chrome and margins."""
+    import numpy as np
+
+    scale = min(1.0, _CROP_PROBE_WIDTH / image.width)
+    probe = image.convert("L").resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))))
+    gray = np.asarray(probe, dtype=np.int16)
+    h = gray.shape[0]
+
+    border = np.concatenate([gray[0], gray[-1], gray[:, 0], gray[:, -1]])
+    ink = np.abs(gray - np.median(border)) > _INK_THRESHOLD
+    ink_rows = np.flatnonzero(ink.any(axis=1))
+    if ink_rows.size == 0:
+        return None
+
+    # Split inked rows into blocks at blank gaps; drop chrome-only edge blocks
+    breaks = np.flatnonzero(np.diff(ink_rows) > 1)
+    starts = np.concatenate([ink_rows[:1], ink_rows[breaks + 1]])
+    ends = np.concatenate([ink_rows[breaks], ink_rows[-1:]])
+    first, last = 0, len(starts) - 1
+    if first < last and ends[first] < h * _STATUS_BAR_FRACTION:
+        first += 1
+    if first < last and starts[last] > h * (1 - _HOME_BAR_FRACTION):
+        last -= 1
+
+    top, bottom = int(starts[first]), int(ends[last]) + 1
+    cols = np.flatnonzero(ink[top:bottom].any(axis=0))
+    left, right = int(cols[0]), int(cols[-1]) + 1
+
+    # Back to full resolution with a small margin so glyph edges survive
+    pad = 2
+    return (
+        max(0, int((left - pad) / scale)),
+        max(0, int((top - pad) / scale)),
+        min(image.width, int((right + pad) / scale) + 1),
+        min(image.height, int((bottom + pad) / scale) + 1),
+    )
+
+
+def _prepare_image(image_bytes: bytes, crop: bool, size: int) -> tuple[str, dict[str, Any]]:
+    """Decode once, crop to the receipt, fit the vision encoder's `size`
+    and re-encode; returns the data URI and size stats.
+
+    With no crop and size 0 the upload is passed through unchanged,
+    labelled with its real MIME type.
     """
+    from PIL import Image
+
+    t0 = time.perf_counter()
+    image = Image.open(io.BytesIO(image_bytes))
+    original_size = image.size
+    mime = Image.MIME.get(image.format or "", "image/jpeg")
+
+    if not crop and size <= 0:
+        uri = _image_bytes_to_base64_uri(image_bytes, mime)
+        return uri, {"original_size": original_size, "vlm_size": original_size, "bytes": len(image_bytes), "prep_ms": 0.0}
+
+    if size > 0 and image.format == "JPEG":
+        # Leave headroom for the crop before the final resize
+        image.draft("RGB", (size * 2, size * 2))
+    image = image.convert("RGB")
+
+    if crop:
+        bbox = _receipt_bbox(image)
+        if bbox is not None:
+            image = image.crop(bbox)
+    if size > 0 and max(image.size) > size:
+        # The encoder squares its input; fitting inside it loses nothing
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=settings.vlm_jpeg_quality)
+    encoded = buf.getvalue()
+    stats = {
+        "original_size": original_size,
+        "vlm_size": image.size,
+        "bytes": len(encoded),
+        "prep_ms": (time.perf_counter() - t0) * 1000,
+    }
+    return _image_bytes_to_base64_uri(encoded, "image/jpeg"), stats
+
+
+def _mentions_hkust(text: str) -> bool:
+    lower = text.lower()
+    return any(kw in lower for kw in _HKUST_KEYWORDS)
+
+
+def _encode_image(image_bytes: bytes, preprocess: bool) -> str:
+    """Data URI for the VLM, cropped and downscaled unless `preprocess` is off."""
+    # Crop and downscale to what the vision encoder actually sees
+    with STAGE_SECONDS.time(stage="vlm_preprocess"):
+        if preprocess:
+            image_uri, prep = _prepare_image(image_bytes, settings.vlm_crop, settings.vlm_image_size)
+        else:
+            image_uri, prep = _prepare_image(image_bytes, crop=False, size=0)
+    logger.info(
+        f"VLM image {prep['original_size']} -> {prep['vlm_size']}, "
+        f"{prep['bytes']} bytes, prep {prep['prep_ms']:.1f}ms"
+    )
+    return image_uri
+
+
+def _extraction_request(image_uri: str) -> dict[str, Any]:
+    """create_chat_completion arguments for the JSON extraction prompt."""
+    return {
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "image_url", "image_url": {"url": image_uri}},
+                    {"type": "text", "text": _EXTRACTION_PROMPT},
+                ],
+            }
+        ],
+        # JSON schema enforcement
+        "response_format": {"type": "json_object", "schema": _RECEIPT_SCHEMA},
+        "temperature": 0.1,  # Low temperature for consistent extraction
+        "max_tokens": 1024,
+    }
+
+
+def _finish(content: str) -> dict[str, Any]:
+    """Parse the generated JSON and derive the validation fields."""
     try:
-        model = _load_model()
-        image_uri = _image_bytes_to_base64_uri(image_bytes)
+        parsed = json.loads(content)
+    except json.JSONDecodeError as e:
+        logger.error(f"JSON Decode Error: {content}")
+        raise ValueError(f"VLM failed to return valid JSON: {e}")
 
-        response = model.create_chat_completion(
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "image_url", "image_url": {"url": image_uri}},
-                        {
-                            "type": "text",
-                            "text": "Does this receipt mention HKUST, Hong Kong University of Science and Technology, or 科技大學? Answer only 'yes' or 'no'.",
-                        },
-                    ],
-                }
-            ],
-            temperature=0.0,
-            max_tokens=10,
-        )
+    # HKUST validation comes from the same generation
+    mentions_hkust = bool(parsed.pop("mentions_hkust", False))
+    parsed["is_valid"] = mentions_hkust or _mentions_hkust(parsed.get("restaurant", ""))
+    parsed["errors"] = []
+    return parsed
 
-        answer = response["choices"][0]["message"]["content"].strip().lower()
-        return "yes" in answer
-    except Exception as e:
-        logger.error(f"Validation check failed: {e}")
-        return False  # Fail safe or fail secure? Fail safe for now, but mark invalid if unsure.
+
+def _error_result(error: Exception) -> dict[str, Any]:
+    return {
+        "order_number": "",
+        "restaurant": "",
+        "items": [],
+        "subtotal": 0.0,
+        "total": 0.0,
+        "is_valid": False,
+        "errors": [str(error)],
+    }
 
 
-def extract_receipt_data(image_bytes: bytes) -> dict[str, Any]:
+def extract_receipt_data(
+    image_bytes: bytes,
+    timeout: float | None = None,
+    cancel: threading.Event | None = None,
+    preprocess: bool = True,
+) -> dict[str, Any]:
     """
     Extract structured receipt data using SmolVLM Q4 GGUF.
-    VLM-only approach - no OCR fallback.
+    VLM-only approach - no OCR fallback. One constrained-JSON generation
+    yields both the fields and the HKUST validation.
+
+    Blocks until a model instance is free, for at most `timeout` seconds
+    (default VLM_QUEUE_TIMEOUT_SECONDS); setting `cancel` gives up the
+    place in the queue. `preprocess=False` sends the upload as is.
 
     Returns:
         dict: Structured receipt data with order_number, items, totals, validation status.
     """
+    if timeout is None:
+        timeout = settings.vlm_queue_timeout_seconds
     try:
-        model = _load_model()
-
-        # Convert image to base64 URI
-        image_uri = _image_bytes_to_base64_uri(image_bytes)
-
-        # Prompt for structured JSON output
-        prompt = """Extract structured data from this McDonald's receipt.
-        Return ONLY valid JSON with this exact structure:
-        {
-          "order_number": "string (order ID from receipt)",
-          "items": [
-            {"name": "string", "quantity": 1, "price": 0.0}
-          ],
-          "subtotal": 0.0,
-          "total": 0.0
-        }
-        
-        CRITICAL RULES:
-        - Meals with add-ons (e.g., "Chicken McNuggets Meal w Filet-O-Fish") are ONE item
-        - Do NOT split meals into separate items
-        - Extract exact prices from receipt (HK$ currency)
-        - Return ONLY JSON, no other text
-        """
-
-        # Call VLM with JSON schema enforcement
-        response = model.create_chat_completion(
+        image_uri = _encode_image(image_bytes, preprocess)
+
+        with _pool.acquire(timeout, cancel) as model, STAGE_SECONDS.time(stage="vlm_extraction"):
+            response = model.create_chat_completion(**_extraction_request(image_uri))
+
+        return _finish(response["choices"][0]["message"]["content"])
+
+    except Exception as e:
+        logger.error(f"VLM Extraction Error: {e}")
+        return _error_result(e)
+
+
+# ─── Streaming ───
+
+# Top-level scalar fields, matched once their value is complete
+_SCALAR_FIELD = re.compile(
+    r'"(order_number|restaurant|subtotal|total)"\s*:\s*'
+    r'("(?:[^"\\]|\\.)*"|-?\d+(?:\.\d+)?(?=\s*[,}]))'
+)
+_ITEMS_START = re.compile(r'"items"\s*:\s*\[')
+
+
+class _PartialReceipt:
+    """Pulls finished fields out of a receipt JSON document as it is generated.
+
+    The schema-constrained output is a flat object plus one `items` array,
+    so scalars are matched once their value is terminated and items are
+    decoded one object at a time.
+    """
+
+    def __init__(self) -> None:
+        self.text = ""
+        self._decoder = json.JSONDecoder()
+        self._seen: set[str] = set()
+        self._items_pos: int | None = None
+        self._items_done = False
+        self.items: list[dict[str, Any]] = []
+
+    def feed(self, delta: str) -> list[tuple[str, dict[str, Any]]]:
+        """Append generated text; returns the ("field" | "item", data) events it completed."""
+        self.text += delta
+        events: list[tuple[str, dict[str, Any]]] = []
+
+        for match in _SCALAR_FIELD.finditer(self.text):
+            name = match.group(1)
+            if name not in self._seen:
+                self._seen.add(name)
+                events.append(("field", {"name": name, "value": json.loads(match.group(2))}))
+
+        if self._items_pos is None:
+            start = _ITEMS_START.search(self.text)
+            if start:
+                self._items_pos = start.end()
+        while self._items_pos is not None and not self._items_done:
+            pos = self._items_pos
+            while pos < len(self.text) and self.text[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(self.text):
+                break
+            if self.text[pos] == "]":
+                self._items_done = True
+                break
+            try:
+                item, end = self._decoder.raw_decode(self.text, pos)
+            except json.JSONDecodeError:
+                break  # object not finished yet
+            self._items_pos = end
+            self.items.append(item)
+            events.append(("item", {"index": len(self.items) - 1, **item}))
+        return events
+
+
+def stream_receipt_data(
+    image_bytes: bytes,
+    timeout: float | None = None,
+    cancel: threading.Event | None = None,
+) -> Iterator[tuple[str, dict[str, Any]]]:
+    """Streaming variant of `extract_receipt_data`.
+
+    Yields (event, data) pairs: "status" once a model instance is acquired,
+    "token" for every generated chunk, "field" / "item" as soon as a receipt
+    field or line item is complete, then a final "result" (same dict as
+    `extract_receipt_data`) or "error". Setting `cancel` stops generation
+    at the next token and frees the model instance.
+    """
+    if timeout is None:
+        timeout = settings.vlm_queue_timeout_seconds
+    try:
+        image_uri = _encode_image(image_bytes, preprocess=True)
+
+        with _pool.acquire(timeout, cancel) as model, STAGE_SECONDS.time(stage="vlm_extraction"):
+            yield "status", {"state": "generating"}
+            partial = _PartialReceipt()
+            chunks = model.create_chat_completion(**_extraction_request(image_uri), stream=True)
+            try:
+                for chunk in chunks:
+                    if cancel is not None and cancel.is_set():
+                        logger.info("VLM stream cancelled by client")
+                        return
+                    delta = chunk["choices"][0]["delta"].get("content") or ""
+                    if not delta:
+                        continue
+                    yield "token", {"text": delta}
+                    yield from partial.feed(delta)
+            finally:
+                # Stops llama.cpp generation if we leave early
+                chunks.close()
+
+        yield "result", _finish(partial.text)
+
+    except Exception as e:
+        logger.error(f"VLM Extraction Error: {e}")
+        yield "error", _error_result(e)
+
+
+def warmup() -> dict[str, float]:
+    """Load every pool instance and prefill one tiny image; returns per-stage seconds."""
+    from PIL import Image
+
+    t0 = time.perf_counter()
+    _pool.warm()
+    t1 = time.perf_counter()
+
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 64), "white").save(buf, format="JPEG")
+    with _pool.acquire() as model:
+        model.create_chat_completion(
             messages=[
                 {
                     "role": "user",
                     "content": [
-                        {"type": "image_url", "image_url": {"url": image_uri}},
-                        {"type": "text", "text": prompt},
+                        {"type": "image_url", "image_url": {"url": _image_bytes_to_base64_uri(buf.getvalue())}},
+                        {"type": "text", "text": "OK"},
                     ],
                 }
             ],
-            response_format={
-                "type": "json_object",
-                "schema": {
-                    "type": "object",
-                    "properties": {
-                        "order_number": {"type": "string"},
-                        "items": {
-                            "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "name": {"type": "string"},
-                                    "quantity": {"type": "integer"},
-                                    "price": {"type": "number"},
-                                },
-                                "required": ["name", "quantity", "price"],
-                            },
-                        },
-                        "subtotal": {"type": "number"},
-                        "total": {"type": "number"},
-                    },
-                    "required": ["order_number", "items", "subtotal", "total"],
-                },
-            },
-            temperature=0.1,  # Low temperature for consistent extraction
-            max_tokens=1024,
+            max_tokens=1,
         )
-
-        # Parse JSON from response
-        content = response["choices"][0]["message"]["content"]
-        try:
-            parsed = json.loads(content)
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON Decode Error: {content}")
-            raise ValueError(f"VLM failed to return valid JSON: {e}")
-
-        # Add HKUST validation
-        parsed["is_valid"] = _check_hkust_validation(image_bytes)
-        parsed["errors"] = []
-
-        return parsed
-
-    except Exception as e:
-        logger.error(f"VLM Extraction Error: {e}")
-        return {
-            "order_number": "",
-            "items": [],
-            "subtotal": 0.0,
-            "total": 0.0,
-            "is_valid": False,
-            "errors": [str(e)],
-        }
+    t2 = time.perf_counter()
+    return {"vlm_load": t1 - t0, "vlm_warmup": t2 - t1}
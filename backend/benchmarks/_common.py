@@ -0,0 +1,32 @@
+"""Setup shared by the benchmark scripts.
+
+Importing this module puts backend/ on sys.path so the scripts can import
+`app`, whatever directory they are started from.
+"""
+
+import multiprocessing
+import sys
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any, TypeVar
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+REPO_DIR = BACKEND_DIR.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+# Screenshots bundled at the repository root
+SAMPLE_IMAGES = ["mcdonald_order_eng.PNG", "mcdonald_order_ch.PNG", "testrun.JPG"]
+
+T = TypeVar("T")
+
+
+def run_isolated(fn: Callable[..., T], *args: Any) -> T:
+    """Run `fn(*args)` in a fresh spawned process and return its result.
+
+    Keeps engine state, environment overrides and peak RSS of one run from
+    leaking into the next. `fn` must be a module-level function.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1) as pool:
+        return pool.apply(fn, args)
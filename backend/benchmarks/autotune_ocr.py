@@ -0,0 +1,144 @@
+"""Pick OCR worker and ONNX Runtime thread counts for this host.
+
+Sweeps (OCR workers x intra-op threads) combinations that fit the core
+count, runs OCR on the bundled sample images with that many concurrent
+workers, and writes the configuration with the best throughput to the
+tuning file that `app.config` reads its OCR defaults from. Environment
+variables still override the tuned values.
+
+Usage (from backend/):
+    python benchmarks/autotune_ocr.py                  # sweep and write .cache/ocr_tuning.json
+    python benchmarks/autotune_ocr.py --dry-run        # sweep and print only
+    python benchmarks/autotune_ocr.py --threads 1,2,4 --workers 1,2
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from _common import REPO_DIR, SAMPLE_IMAGES
+
+from app.config import settings  # noqa: E402
+from app.services.ocr_service import EngineOptions, _decode_image, build_engine  # noqa: E402
+
+
+def _powers_of_two_upto(n: int) -> list[int]:
+    values = [1]
+    while values[-1] * 2 <= n:
+        values.append(values[-1] * 2)
+    if values[-1] != n:
+        values.append(n)
+    return values
+
+
+def _parse_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def run_config(workers: int, threads: int, images: list[Any], rounds: int) -> dict[str, float]:
+    """Throughput and latency of `workers` concurrent OCR calls, each engine
+    session using `threads` intra-op threads.
+
+    Thread executors share one engine; process executors get one per
+    worker (emulated here with one engine per thread, as ORT releases the GIL).
+    """
+    options = replace(EngineOptions.from_settings(), intra_op_threads=threads)
+    shared = build_engine(options) if settings.ocr_executor == "thread" else None
+    local = threading.local()
+
+    def engine() -> Any:
+        if shared is not None:
+            return shared
+        if not hasattr(local, "engine"):
+            local.engine = build_engine(options)
+        return local.engine
+
+    def ocr(img: Any) -> float:
+        t0 = time.perf_counter()
+        engine()(img)
+        return time.perf_counter() - t0
+
+    jobs = images * rounds
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(ocr, images * workers))  # warm up every worker
+        t0 = time.perf_counter()
+        latencies = list(pool.map(ocr, jobs))
+        wall = time.perf_counter() - t0
+    return {
+        "images_per_s": len(jobs) / wall,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "max_ms": max(latencies) * 1000,
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    cpus = os.cpu_count() or 1
+    ap.add_argument("--threads", type=_parse_list, help=f"intra-op thread counts (default: powers of 2 up to {cpus})")
+    ap.add_argument("--workers", type=_parse_list, help=f"OCR worker counts (default: powers of 2 up to {cpus})")
+    ap.add_argument("--rounds", type=int, default=3, help="passes over the sample images per configuration")
+    ap.add_argument("--output", type=Path, default=Path(settings.ocr_tuning_file))
+    ap.add_argument("--dry-run", action="store_true", help="print results without writing the tuning file")
+    args = ap.parse_args()
+
+    images = [_decode_image((REPO_DIR / name).read_bytes())[0] for name in SAMPLE_IMAGES]
+    # Oversubscribed combinations only run when asked for explicitly
+    explicit = bool(args.workers and args.threads)
+    candidates = [
+        (w, t)
+        for w in args.workers or _powers_of_two_upto(cpus)
+        for t in args.threads or _powers_of_two_upto(cpus)
+        if explicit or w * t <= cpus
+    ]
+
+    results: list[dict[str, Any]] = []
+    print(f"{'workers':>8}{'threads':>9}{'images/s':>11}{'p50':>11}{'max':>11}")
+    for workers, threads in candidates:
+        r = {"workers": workers, "threads": threads, **run_config(workers, threads, images, args.rounds)}
+        results.append(r)
+        print(f"{workers:>8}{threads:>9}{r['images_per_s']:>11.2f}{r['p50_ms']:>9.0f}ms{r['max_ms']:>9.0f}ms")
+
+    # Best throughput; within 5% of it, prefer fewer cores in use, then lower latency
+    top = max(r["images_per_s"] for r in results)
+    best = min(
+        (r for r in results if r["images_per_s"] >= 0.95 * top),
+        key=lambda r: (r["workers"] * r["threads"], r["p50_ms"]),
+    )
+    tuned = {"ocr_workers": best["workers"], "ocr_intra_op_threads": best["threads"]}
+    print(f"\nBest: {best['workers']} workers x {best['threads']} threads ({best['images_per_s']:.2f} images/s)")
+
+    if not args.dry_run:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(
+            json.dumps(
+                {
+                    "meta": {
+                        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                        "machine": platform.machine(),
+                        "processor": platform.processor(),
+                        "cpus": cpus,
+                        "executor": settings.ocr_executor,
+                    },
+                    "settings": tuned,
+                    "results": results,
+                },
+                indent=2,
+            ),
+            encoding="utf-8",
+        )
+        print(f"Tuning saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""Benchmark menu catalog lookups against a linear scan on large catalogs.
+
+Builds synthetic catalogs of thousands of English menu names, looks up
+noisy copies of their names (one character changed) with the trigram
+index and with a scan that scores every name, and reports the time per
+lookup and the share of names the index scores. Exits 1 if the index
+ever returns another match than the scan.
+
+Usage (from backend/):
+    python benchmarks/bench_menu_catalog.py
+    python benchmarks/bench_menu_catalog.py --sizes 1000 100000 --queries 500
+"""
+
+import argparse
+import random
+import string
+import sys
+import time
+
+import _common  # noqa: F401  puts backend/ on sys.path
+
+from app.services.menu_catalog import (
+    MIN_SCORE,
+    ORDER_KINDS,
+    MenuCatalog,
+    MenuEntry,
+    MenuMatch,
+    _compatible,
+    _fold,
+    _trigrams,
+)
+
+SIZES = ["(S)", "(M)", "(L)", "(6pcs)", "(9pcs)", ""]
+# Distinct words across a large multi-restaurant menu
+VOCABULARY = 5000
+SYLLABLES = [c + v for c in "bcdfghklmnprstvz" for v in "aeiou"]
+
+
+def make_vocabulary(rng: random.Random) -> list[str]:
+    words: set[str] = set()
+    while len(words) < VOCABULARY:
+        words.add("".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))).capitalize())
+    return sorted(words)
+
+
+def make_catalog(size: int, rng: random.Random) -> MenuCatalog:
+    vocabulary = make_vocabulary(rng)
+    names: set[str] = set()
+    while len(names) < size:
+        words = " ".join(rng.sample(vocabulary, rng.randint(3, 5)))
+        names.add(f"{words} {rng.choice(SIZES)}".strip())
+    return MenuCatalog([MenuEntry(name, "", "item") for name in sorted(names)])
+
+
+def _typo(name: str, rng: random.Random) -> str:
+    letters = [i for i, c in enumerate(name) if c.isalpha()]
+    i = rng.choice(letters)
+    return name[:i] + rng.choice(string.ascii_lowercase) + name[i + 1 :]
+
+
+def linear_match(catalog: MenuCatalog, text: str) -> MenuMatch | None:
+    """What `MenuCatalog.match` returns, by scoring every indexed name."""
+    folded, qualifiers, variants = _fold(text)
+    grams = _trigrams(folded)
+    best: MenuMatch | None = None
+    for entry, name, key_qualifiers, key_variants, key_grams in catalog._keys:
+        if entry.kind not in ORDER_KINDS or not _compatible(qualifiers, variants, key_qualifiers, key_variants):
+            continue
+        score = 2 * len(grams & key_grams) / (len(grams) + len(key_grams))
+        if score >= MIN_SCORE and (best is None or score > best.score):
+            best = MenuMatch(entry, name, score)
+    return best
+
+
+def _per_lookup_us(fn, queries: list[str]) -> float:
+    t0 = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return (time.perf_counter() - t0) / len(queries) * 1e6
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    ap.add_argument("--queries", type=int, default=300)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    mismatches = 0
+    print(f"{'entries':>8}{'index':>14}{'scan':>14}{'speedup':>10}{'scored':>9}{'found':>8}")
+    for size in args.sizes:
+        catalog = make_catalog(size, rng)
+        queries = [_typo(rng.choice(catalog.entries).name, rng) for _ in range(args.queries)]
+
+        indexed = [catalog._match(q, ORDER_KINDS, MIN_SCORE) for q in queries]
+        scanned = [linear_match(catalog, q) for q in queries]
+        for q, a, b in zip(queries, indexed, scanned):
+            if (a and (a.name, a.score)) != (b and (b.name, b.score)):
+                # Equal scores may resolve to different names; only a score gap is a miss
+                if a is None or b is None or a.score != b.score:
+                    mismatches += 1
+                    print(f"  {q!r}: index={a and a.name!r} scan={b and b.name!r}")
+
+        index_us = _per_lookup_us(lambda q: catalog._match(q, ORDER_KINDS, MIN_SCORE), queries)
+        scan_us = _per_lookup_us(lambda q: linear_match(catalog, q), queries)
+        # Names the index scores per lookup, as a share of the catalog's names
+        scored = sum(len(catalog._candidates(_trigrams(_fold(q)[0]), MIN_SCORE)) for q in queries)
+        scored /= len(queries) * len(catalog._keys)
+        found = sum(m is not None for m in indexed) / len(queries)
+        print(
+            f"{size:>8}{index_us:>12.1f}us{scan_us:>12.1f}us{scan_us / index_us:>9.1f}x"
+            f"{scored:>9.1%}{found:>8.0%}"
+        )
+
+    if mismatches:
+        print(f"\n[FAIL] {mismatches} lookup(s) differ from the linear scan")
+        return 1
+    print("\n[PASS] indexed lookups match the linear scan")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
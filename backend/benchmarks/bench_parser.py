@@ -0,0 +1,268 @@
+"""Benchmark the receipt parser on synthetic, scalable OCR fixtures.
+
+Generates McDonald's-app-style OCR results (`OCRResult`s, as returned by
+ocr_service) with a configurable number of screenshots, rows per
+screenshot and items per order, times each parser stage and
+`parse_mcd_app_receipt` end to end, and compares against a saved baseline.
+
+Usage (from backend/):
+    python benchmarks/bench_parser.py                      # run and print
+    python benchmarks/bench_parser.py --save-baseline      # write baseline JSON
+    python benchmarks/bench_parser.py --compare            # exit 1 on regression
+    python benchmarks/bench_parser.py --samples            # + OCR on bundled images
+    python benchmarks/bench_parser.py --case 12:40:30      # custom screenshots:rows:items
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from collections.abc import Callable
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from _common import REPO_DIR, SAMPLE_IMAGES
+
+from app.services.ocr_result import OCRResult  # noqa: E402
+from app.services.receipt_parser import (  # noqa: E402
+    _convert_ocr_entries,
+    cluster_rows,
+    find_sections,
+    has_qty_on_right,
+    merge_screenshots,
+    parse_items,
+    parse_mcd_app_receipt,
+)
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+# (screenshots, rows per screenshot, items per order)
+DEFAULT_CASES = [(1, 25, 1), (3, 30, 5), (10, 40, 20), (20, 40, 50)]
+
+ROW_PITCH = 60  # px between rows, roughly a phone screenshot at 3x
+OVERLAP_ROWS = 3  # rows repeated between consecutive screenshots
+
+ITEM_NAMES = [
+    "Chicken McNuggets Meal (6pcs) w Filet-O-Fish",
+    "Big Mac Meal",
+    "McSpicy Chicken Filet Burger",
+    "Quarter Pounder with Cheese",
+    "Apple Pie",
+    "McFlurry with OREO Cookies",
+    "Double Cheeseburger Meal",
+    "Sausage McMuffin with Egg",
+]
+DETAIL_NAMES = [
+    "Fries (M)",
+    "Coca-Cola No Sugar (M)",
+    "Hot Mustard Sauce",
+    "Filet-O-Fish",
+    "Hash Browns",
+    "No add-on, thank you!",
+    "Corn Cup (R)",
+    "Sprite (M)",
+]
+
+
+# =========================================================
+# Synthetic fixtures
+# =========================================================
+
+
+def _box(text: str, x: float, y: float, h: float = 40.0) -> list[Any]:
+    """One RapidOCR-style [bbox, text, confidence] detection."""
+    w = 18.0 * len(text)
+    bbox = [[x - w / 2, y - h / 2], [x + w / 2, y - h / 2], [x + w / 2, y + h / 2], [x - w / 2, y + h / 2]]
+    return [bbox, text, 0.95]
+
+
+def _receipt_rows(total_rows: int, items: int, rng: random.Random) -> list[list[tuple[str, float]]]:
+    """Logical receipt rows as [(text, x)] with item details padded to size."""
+    header = [
+        [("Order Details", 590)],
+        [("Order #", 120), (str(rng.randint(100, 999)), 1050)],
+        [("Serving restaurant", 200)],
+        [("The Hong Kong University of Science", 420)],
+        [("& Technology", 160)],
+        [("Order Summary", 210)],
+    ]
+    footer = [
+        [("Payment Details", 220)],
+        [("Subtotal", 140), ("HK$ 43.00", 1040)],
+        [("Total", 110), ("HK$ 43.00", 1040)],
+    ]
+    body_rows = max(items, total_rows - len(header) - len(footer))
+    details_per_item = max(0, body_rows // items - 1)
+
+    body: list[list[tuple[str, float]]] = []
+    for i in range(items):
+        body.append([(ITEM_NAMES[i % len(ITEM_NAMES)], 360), (str(rng.randint(1, 3)), 1100)])
+        for d in range(details_per_item):
+            body.append([(DETAIL_NAMES[(i + d) % len(DETAIL_NAMES)], 300)])
+    return header + body + footer
+
+
+def make_fixture(screenshots: int, rows_per_screenshot: int, items: int, seed: int = 0) -> list[OCRResult]:
+    """Per-image OCR results for one receipt spread over `screenshots` images,
+    consecutive images sharing OVERLAP_ROWS rows like real scroll captures."""
+    rng = random.Random(seed)
+    step = max(1, rows_per_screenshot - OVERLAP_ROWS) if screenshots > 1 else rows_per_screenshot
+    total_rows = step * (screenshots - 1) + rows_per_screenshot
+    rows = _receipt_rows(total_rows, items, rng)
+
+    per_image: list[OCRResult] = []
+    for s in range(screenshots):
+        start = s * step
+        chunk = rows[start : start + rows_per_screenshot] if s < screenshots - 1 else rows[start:]
+        results = []
+        for r, row in enumerate(chunk):
+            y = 150 + r * ROW_PITCH + rng.uniform(-3, 3)
+            for text, x in row:
+                results.append(_box(text, x + rng.uniform(-4, 4), y + rng.uniform(-2, 2)))
+        per_image.append(OCRResult.from_raw(results))
+    return per_image
+
+
+# =========================================================
+# Timing
+# =========================================================
+
+
+def _median_ms(fn: Callable[[], Any], repeat: int) -> float:
+    fn()  # warm up
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def bench_case(per_image: list[OCRResult], repeat: int) -> dict[str, float]:
+    entries_list = [_convert_ocr_entries(r) for r in per_image]
+    entries = merge_screenshots(entries_list)
+    rows = cluster_rows(entries)
+    sec_idx = find_sections(rows)
+
+    return {
+        "convert_entries": _median_ms(lambda: [_convert_ocr_entries(r) for r in per_image], repeat),
+        "merge_screenshots": _median_ms(lambda: merge_screenshots(entries_list), repeat),
+        "cluster_rows": _median_ms(lambda: cluster_rows(entries), repeat),
+        "find_sections": _median_ms(lambda: find_sections(rows), repeat),
+        "has_qty_on_right": _median_ms(lambda: [has_qty_on_right(r) for r in rows], repeat),
+        "parse_items": _median_ms(lambda: parse_items(rows, sec_idx), repeat),
+        "end_to_end": _median_ms(lambda: parse_mcd_app_receipt(per_image), repeat),
+    }
+
+
+def bench_samples(repeat: int) -> dict[str, dict[str, float]]:
+    """OCR + parse on the bundled screenshots (needs rapidocr)."""
+    from app.services.ocr_service import extract_text_with_metadata
+
+    results: dict[str, dict[str, float]] = {}
+    for name in SAMPLE_IMAGES:
+        image_bytes = (REPO_DIR / name).read_bytes()
+        ocr = extract_text_with_metadata(image_bytes)
+        results[f"sample:{name}"] = {
+            "parse": _median_ms(lambda: parse_mcd_app_receipt([ocr]), repeat),
+            "end_to_end": _median_ms(
+                lambda: parse_mcd_app_receipt([extract_text_with_metadata(image_bytes)]),
+                max(1, repeat // 10),
+            ),
+        }
+    return results
+
+
+# =========================================================
+# Baseline comparison
+# =========================================================
+
+
+def compare(
+    current: dict[str, dict[str, float]],
+    baseline: dict[str, dict[str, float]],
+    threshold: float,
+    min_delta_ms: float,
+) -> list[str]:
+    """Stages slower than baseline by more than `threshold`x and `min_delta_ms`."""
+    regressions = []
+    for case, stages in current.items():
+        for stage, ms in stages.items():
+            base = baseline.get(case, {}).get(stage)
+            if base is None:
+                continue
+            if ms > base * threshold and ms - base > min_delta_ms:
+                regressions.append(f"{case} {stage}: {base:.3f}ms -> {ms:.3f}ms ({ms / base:.2f}x)")
+    return regressions
+
+
+def _print_table(results: dict[str, dict[str, float]]) -> None:
+    stages = list(dict.fromkeys(stage for r in results.values() for stage in r))
+    print(f"{'case':<34}" + "".join(f"{s:>18}" for s in stages))
+    for case, r in results.items():
+        print(f"{case:<34}" + "".join(f"{r[s]:>16.3f}ms" if s in r else f"{'-':>18}" for s in stages))
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--case", action="append", default=[], help="screenshots:rows:items (repeatable)")
+    ap.add_argument("--repeat", type=int, default=30, help="timed runs per stage (median reported)")
+    ap.add_argument("--samples", action="store_true", help="also run OCR+parse on the bundled images")
+    ap.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--compare", action="store_true", help="fail if a stage regressed past --threshold")
+    ap.add_argument("--threshold", type=float, default=1.5, help="allowed slowdown factor")
+    ap.add_argument("--min-delta-ms", type=float, default=0.05, help="ignore smaller absolute slowdowns")
+    args = ap.parse_args()
+
+    cases = [tuple(int(v) for v in c.split(":")) for c in args.case] or DEFAULT_CASES
+
+    results: dict[str, dict[str, float]] = {}
+    for screenshots, rows, items in cases:
+        fixture = make_fixture(screenshots, rows, items)
+        results[f"s{screenshots}_r{rows}_i{items}"] = bench_case(fixture, args.repeat)
+    if args.samples:
+        results.update(bench_samples(args.repeat))
+
+    _print_table(results)
+
+    if args.save_baseline:
+        args.baseline.write_text(
+            json.dumps(
+                {
+                    "meta": {
+                        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                        "python": platform.python_version(),
+                        "machine": platform.machine(),
+                        "repeat": args.repeat,
+                    },
+                    "results": results,
+                },
+                indent=2,
+            ),
+            encoding="utf-8",
+        )
+        print(f"\nBaseline saved to {args.baseline}")
+
+    if args.compare:
+        if not args.baseline.exists():
+            print(f"\nNo baseline at {args.baseline}; run with --save-baseline first")
+            return 2
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))["results"]
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n[FAIL] {len(regressions)} stage(s) regressed past {args.threshold}x:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\n[PASS] no stage regressed past {args.threshold}x")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""Accuracy / latency gate for the INT8 OCR model profile.
+
+Runs OCR + `parse_mcd_app_receipt` on the bundled English and Chinese
+samples and testrun.JPG with the FP32 and the INT8 engine profile, each in
+its own process so peak memory is measured separately. Reports per-field
+agreement (order number, restaurant, items, subtotal, total, HKUST
+validity), detection / recognition / total latency and peak RSS.
+
+Exits 1 if any field differs or INT8 recognition is not at least
+--min-rec-speedup times faster, so it can guard switching
+OCR_MODEL_PROFILE to int8 on a given host.
+
+Usage (from backend/):
+    python benchmarks/quantize_ocr.py --mode static    # produce the INT8 models first
+    python benchmarks/int8_gate.py
+    python benchmarks/int8_gate.py --repeat 5 --json int8_gate.json
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+from _common import REPO_DIR, SAMPLE_IMAGES, run_isolated
+
+FIELDS = ["order_number", "restaurant", "items", "subtotal", "total", "is_valid"]
+
+
+def _peak_rss_mb() -> float:
+    import resource
+
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def run_profile(profile: str, repeat: int) -> dict[str, Any]:
+    """OCR + parse every sample with one engine profile (runs in a fresh process)."""
+    from app.services.ocr_service import EngineOptions, build_engine, extract_text_with_metadata
+    from app.services.receipt_parser import parse_mcd_app_receipt
+
+    base_rss = _peak_rss_mb()
+    t0 = time.perf_counter()
+    engine = build_engine(EngineOptions.from_settings(profile))
+    load_ms = (time.perf_counter() - t0) * 1000
+    loaded_rss = _peak_rss_mb()
+
+    images: dict[str, Any] = {}
+    for name in SAMPLE_IMAGES:
+        image_bytes = (REPO_DIR / name).read_bytes()
+        extract_text_with_metadata(image_bytes, engine)  # warm up
+        runs = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            ocr = extract_text_with_metadata(image_bytes, engine)
+            runs.append((time.perf_counter() - t0) * 1000)
+        parsed = parse_mcd_app_receipt([ocr])
+        images[name] = {
+            "fields": {f: parsed[f] for f in FIELDS},
+            "total_ms": statistics.median(runs),
+            "det_ms": ocr.preprocess["det_ms"],
+            "rec_ms": ocr.preprocess["rec_ms"],
+        }
+    return {
+        "load_ms": load_ms,
+        "engine_rss_mb": loaded_rss - base_rss,
+        "peak_rss_mb": _peak_rss_mb(),
+        "images": images,
+    }
+
+
+def _items_key(items: list[dict[str, Any]]) -> list[tuple[str, int, float]]:
+    return [(i["name"], i["quantity"], i["price"]) for i in items]
+
+
+def compare(fp32: dict[str, Any], int8: dict[str, Any]) -> dict[str, dict[str, bool]]:
+    """{image: {field: agrees}}"""
+    agreement: dict[str, dict[str, bool]] = {}
+    for name, ref in fp32["images"].items():
+        got = int8["images"][name]["fields"]
+        agreement[name] = {
+            f: (_items_key(ref["fields"][f]) == _items_key(got[f])) if f == "items" else ref["fields"][f] == got[f]
+            for f in FIELDS
+        }
+    return agreement
+
+
+def _ratio(a: float, b: float) -> str:
+    return f"{a / b:.2f}x" if b else "-"
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--repeat", type=int, default=3, help="timed OCR runs per image (median reported)")
+    ap.add_argument("--min-rec-speedup", type=float, default=1.0, help="required FP32/INT8 recognition time ratio")
+    ap.add_argument("--json", type=Path, help="also write the full report here")
+    args = ap.parse_args()
+
+    from app.config import settings
+    from app.services.ocr_service import INT8_MODEL_FILES
+
+    missing = [f for f in INT8_MODEL_FILES.values() if not (Path(settings.ocr_int8_model_dir) / f).exists()]
+    if missing and not (settings.ocr_det_model and settings.ocr_rec_model):
+        print(f"INT8 models {missing} not found in {settings.ocr_int8_model_dir}; run quantize_ocr.py first")
+        return 2
+
+    fp32 = run_isolated(run_profile, "fp32", args.repeat)
+    int8 = run_isolated(run_profile, "int8", args.repeat)
+    agreement = compare(fp32, int8)
+
+    print(f"{'image':<26}" + "".join(f"{f:>14}" for f in FIELDS))
+    for name, fields in agreement.items():
+        print(f"{name:<26}" + "".join(f"{'ok' if ok else 'DIFF':>14}" for ok in fields.values()))
+
+    print(f"\n{'image':<26}{'stage':>8}{'fp32':>12}{'int8':>12}{'speedup':>10}")
+    rec_fp32 = rec_int8 = 0.0
+    for name in SAMPLE_IMAGES:
+        for stage in ("det_ms", "rec_ms", "total_ms"):
+            a, b = fp32["images"][name][stage], int8["images"][name][stage]
+            print(f"{name:<26}{stage[:-3]:>8}{a:>10.1f}ms{b:>10.1f}ms{_ratio(a, b):>10}")
+        rec_fp32 += fp32["images"][name]["rec_ms"]
+        rec_int8 += int8["images"][name]["rec_ms"]
+
+    print(f"\n{'':<26}{'fp32':>12}{'int8':>12}{'delta':>12}")
+    for key, unit in (("load_ms", "ms"), ("engine_rss_mb", "MB"), ("peak_rss_mb", "MB")):
+        a, b = fp32[key], int8[key]
+        print(f"{key:<26}{a:>10.1f}{unit}{b:>10.1f}{unit}{b - a:>+10.1f}{unit}")
+
+    disagreements = [f"{name}: {f}" for name, fields in agreement.items() for f, ok in fields.items() if not ok]
+    rec_speedup = rec_fp32 / rec_int8 if rec_int8 else 0.0
+    if args.json:
+        args.json.write_text(
+            json.dumps({"fp32": fp32, "int8": int8, "agreement": agreement, "rec_speedup": rec_speedup},
+                       indent=2, ensure_ascii=False),
+            encoding="utf-8",
+        )
+
+    failed = False
+    if disagreements:
+        print(f"\n[FAIL] {len(disagreements)} field(s) differ:")
+        for name, fields in agreement.items():
+            for f, ok in fields.items():
+                if not ok:
+                    ref, got = fp32["images"][name]["fields"][f], int8["images"][name]["fields"][f]
+                    print(f"  {name} {f}: fp32={ref!r} int8={got!r}")
+        failed = True
+    if rec_speedup < args.min_rec_speedup:
+        print(f"\n[FAIL] INT8 recognition speedup {rec_speedup:.2f}x < {args.min_rec_speedup}x")
+        failed = True
+    if not failed:
+        print(f"\n[PASS] all fields agree; INT8 recognition {rec_speedup:.2f}x faster")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
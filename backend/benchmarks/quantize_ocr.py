@@ -0,0 +1,153 @@
+"""Quantize the OCR detection and recognition models to INT8.
+
+Writes det_int8.onnx and rec_int8.onnx into OCR_INT8_MODEL_DIR, the model
+files of the `OCR_MODEL_PROFILE=int8` engine profile. The source models
+are the FP32 ones the engine loads by default (RapidOCR's bundled models
+or OCR_DET_MODEL / OCR_REC_MODEL, e.g. a Paddle2ONNX export as in
+paddleocr-to-onnxocr.md). Classification is small and stays FP32.
+
+  dynamic  weights are INT8, activation ranges are computed at run time.
+  static   weights and activations are INT8 (QDQ format); activation ranges
+           are calibrated on the real det / rec inputs seen while running
+           the FP32 engine over the calibration images.
+
+Check the result with benchmarks/int8_gate.py before switching profiles.
+Needs the `onnx` package (pip install onnx), which the server does not.
+
+Usage (from backend/):
+    python benchmarks/quantize_ocr.py                     # dynamic
+    python benchmarks/quantize_ocr.py --mode static       # calibrate on the sample images
+    python benchmarks/quantize_ocr.py --mode static --calibration path/to/screenshots
+"""
+
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any
+
+from _common import REPO_DIR, SAMPLE_IMAGES
+
+from app.config import settings  # noqa: E402
+from app.services.ocr_service import INT8_MODEL_FILES, EngineOptions, _decode_image, build_engine  # noqa: E402
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp"}
+
+# Calibration runs the model with every intermediate tensor as an output, so
+# full-screen det inputs need several GB; calibrate det on square windows instead
+DET_CALIBRATION_WINDOW = 320
+DET_WINDOWS_PER_INPUT = 4
+
+
+class _Recorder:
+    """Stands in for a RapidOCR session wrapper and keeps every input it sees."""
+
+    def __init__(self, wrapper: Any) -> None:
+        self.wrapper = wrapper
+        self.inputs: list[Any] = []
+
+    def __call__(self, input_content: Any) -> Any:
+        self.inputs.append(input_content)
+        return self.wrapper(input_content)
+
+
+class _Inputs:
+    """onnxruntime CalibrationDataReader over recorded model inputs."""
+
+    def __init__(self, input_name: str, arrays: list[Any]) -> None:
+        self._feeds = iter([{input_name: a} for a in arrays])
+
+    def get_next(self) -> dict[str, Any] | None:
+        return next(self._feeds, None)
+
+
+def _det_windows(inputs: list[Any]) -> list[Any]:
+    """Square windows spread down each (1, 3, H, W) det input."""
+    size = DET_CALIBRATION_WINDOW
+    windows = []
+    for x in inputs:
+        h, w = x.shape[2:]
+        if h <= size and w <= size:
+            windows.append(x)
+            continue
+        left = max(0, (w - size) // 2)
+        for i in range(DET_WINDOWS_PER_INPUT):
+            top = max(0, (h - size) * i // max(1, DET_WINDOWS_PER_INPUT - 1))
+            windows.append(x[:, :, top : top + size, left : left + size].copy())
+    return windows
+
+
+def _at_least_opset_13(path: str, tmp: Path) -> str:
+    """Per-channel QDQ needs opset 13; Paddle2ONNX exports default to 11."""
+    import onnx
+    from onnx import version_converter
+
+    model = onnx.load(path)
+    opset = next(o.version for o in model.opset_import if o.domain in ("", "ai.onnx"))
+    if opset >= 13:
+        return path
+    upgraded = tmp / f"opset13_{Path(path).name}"
+    onnx.save(version_converter.convert_version(model, 13), str(upgraded))
+    return str(upgraded)
+
+
+def _calibration_images(directory: Path | None) -> list[bytes]:
+    if directory is None:
+        return [(REPO_DIR / name).read_bytes() for name in SAMPLE_IMAGES]
+    return [p.read_bytes() for p in sorted(directory.iterdir()) if p.suffix.lower() in IMAGE_SUFFIXES]
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--mode", choices=("dynamic", "static"), default="dynamic")
+    ap.add_argument("--calibration", type=Path, help="directory of screenshots for static calibration")
+    ap.add_argument("--output-dir", type=Path, default=Path(settings.ocr_int8_model_dir))
+    args = ap.parse_args()
+
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    engine = build_engine(EngineOptions.from_settings(profile="fp32"))
+    wrappers = {"det": engine.text_det.infer, "rec": engine.text_rec.session}
+
+    recorders: dict[str, _Recorder] = {}
+    if args.mode == "static":
+        recorders = {"det": _Recorder(wrappers["det"]), "rec": _Recorder(wrappers["rec"])}
+        engine.text_det.infer, engine.text_rec.session = recorders["det"], recorders["rec"]
+        images = _calibration_images(args.calibration)
+        for image_bytes in images:
+            engine(_decode_image(image_bytes)[0])
+        print(f"Calibrating on {len(images)} images")
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        for stage, wrapper in wrappers.items():
+            source = wrapper.session._model_path
+            target = args.output_dir / INT8_MODEL_FILES[stage]
+            # Shape inference and graph folding first, as ORT recommends
+            prepared = Path(tmp) / f"{stage}.onnx"
+            quant_pre_process(_at_least_opset_13(source, Path(tmp)), str(prepared), skip_symbolic_shape=True)
+
+            if args.mode == "dynamic":
+                quantize_dynamic(str(prepared), str(target), weight_type=QuantType.QUInt8)
+            else:
+                input_name = wrapper.session.get_inputs()[0].name
+                inputs = recorders[stage].inputs
+                if stage == "det":
+                    inputs = _det_windows(inputs)
+                quantize_static(
+                    str(prepared),
+                    str(target),
+                    _Inputs(input_name, inputs),
+                    quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8,
+                    weight_type=QuantType.QInt8,
+                    per_channel=True,
+                )
+            size_mb = Path(source).stat().st_size / 1e6, target.stat().st_size / 1e6
+            print(f"{stage}: {source} ({size_mb[0]:.1f}MB) -> {target} ({size_mb[1]:.1f}MB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""Check that the recognition crop cache does not change OCR output.
+
+OCRs a sequence of screenshots that share UI labels (the bundled samples,
+testrun.JPG twice, and shifted / JPEG re-encoded copies of the English
+sample) once with the crop cache and once without, each in a fresh
+process, and compares every recognised line. Exits 1 on any difference.
+
+Usage (from backend/):
+    python benchmarks/rec_cache_check.py
+"""
+
+import io
+import sys
+from typing import Any
+
+from _common import REPO_DIR, run_isolated
+
+SEQUENCE = ["mcdonald_order_eng.PNG", "testrun.JPG", "mcdonald_order_ch.PNG", "testrun.JPG"]
+SHIFTS = [37, 46]  # rows scrolled off the English sample, JPEG q90
+
+
+def _shifted(image_bytes: bytes, rows: int) -> bytes:
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    shifted = Image.new("RGB", image.size, "white")
+    shifted.paste(image.crop((0, rows, image.width, image.height)), (0, 0))
+    buf = io.BytesIO()
+    shifted.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def _images() -> list[tuple[str, bytes]]:
+    images = [(name, (REPO_DIR / name).read_bytes()) for name in SEQUENCE]
+    english = (REPO_DIR / SEQUENCE[0]).read_bytes()
+    return images + [(f"{SEQUENCE[0]} -{rows}px", _shifted(english, rows)) for rows in SHIFTS]
+
+
+def run(cache_entries: int) -> dict[str, Any]:
+    """OCR the sequence in a fresh process with the given cache size."""
+    import os
+
+    os.environ["OCR_REC_CACHE_ENTRIES"] = str(cache_entries)
+    from app.services.ocr_service import extract_text_with_metadata
+    from app.services.rec_cache import rec_cache
+
+    texts = [extract_text_with_metadata(image_bytes).texts for _, image_bytes in _images()]
+    return {"texts": texts, "hits": rec_cache.hits, "misses": rec_cache.misses}
+
+
+def main() -> int:
+    cached, uncached = run_isolated(run, 2048), run_isolated(run, 0)
+    print(f"Crop cache: {cached['hits']} hits, {cached['misses']} misses")
+
+    differences = 0
+    for (name, _), got, want in zip(_images(), cached["texts"], uncached["texts"]):
+        diff = [(a, b) for a, b in zip(got, want) if a != b]
+        if len(got) != len(want):
+            diff.append((f"{len(got)} lines", f"{len(want)} lines"))
+        differences += len(diff)
+        print(f"{name:<32}{'ok' if not diff else 'DIFF'}")
+        for a, b in diff:
+            print(f"  cached={a!r} uncached={b!r}")
+
+    if differences:
+        print(f"\n[FAIL] {differences} line(s) differ with the crop cache")
+        return 1
+    print("\n[PASS] cached output identical to uncached")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,10 @@
+import os
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+REPO_DIR = BACKEND_DIR.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Settings are read at import; keep test runs out of the on-disk OCR cache
+os.environ.setdefault("OCR_CACHE_DIR", "")
@@ -0,0 +1,70 @@
+import pytest
+
+from app.services.menu_catalog import MenuCatalog, MenuEntry, get_catalog
+from app.services.receipt_parser import cluster_rows, find_sections, parse_items, validate_totals
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Cheeseburger Meal",
+        "Double Big Mac",
+        "Chicken McNuggets Meal (9pcs)",
+        "麥樂雞套餐 (9件)",
+        "Chicken McNuggets Meal (6pcs) w McSpicy Chicken Filet Burger",
+        "Big Mac Meal w Fries (L)",
+    ],
+)
+def test_other_products_keep_their_name(text):
+    assert get_catalog().match(text) is None
+
+
+@pytest.mark.parametrize(
+    ("text", "name"),
+    [
+        ("Chicken McNugget Meal (6pcs) w Filet-O-Fish", "Chicken McNuggets Meal (6pcs) w Filet-O-Fish"),
+        ("Coca-Cola@ No Sugar(M)", "Coca-Cola No Sugar (M)"),
+        ("6件麥樂雞配魚柳包套餐", "6件麥樂雞配魚柳包套餐"),
+    ],
+)
+def test_near_exact_reads_are_canonicalized(text, name):
+    match = get_catalog().match(text)
+    assert match is not None and match.name == name
+
+
+PRICED = MenuCatalog(
+    [
+        MenuEntry("Big Mac Meal", "巨無霸套餐", "meal", 43.0),
+        MenuEntry("Filet-O-Fish", "魚柳包", "item", 18.5),
+        MenuEntry("Apple Pie", "蘋果批", "item"),
+        MenuEntry("Fries (L)", "薯條 (大)", "addon", 3.0),
+    ]
+)
+
+
+def _rows(lines: list[tuple[str, int | None]]) -> list[list[dict]]:
+    entries = []
+    for i, (text, qty) in enumerate(lines):
+        y = 50.0 + i * 60
+        entries.append({"text": text, "x": 100.0, "y": y, "h": 30.0})
+        if qty is not None:
+            entries.append({"text": str(qty), "x": 900.0, "y": y, "h": 30.0})
+    return cluster_rows(entries)
+
+
+def test_prices_filled_from_catalog():
+    rows = _rows([("Order Summary", None), ("Big Mac Meal", 1), ("Fries (L)", None), ("Filet-O-Fish", 2)])
+    items = parse_items(rows, find_sections(rows), PRICED)
+    assert items == [
+        {"name": "Big Mac Meal", "quantity": 1, "price": 46.0},
+        {"name": "Filet-O-Fish", "quantity": 2, "price": 18.5},
+    ]
+    assert validate_totals(items, 83.0, 83.0) == []
+    assert validate_totals(items, 90.0, 90.0) == ["Subtotal mismatch"]
+
+
+def test_unpriced_item_skips_subtotal_check():
+    rows = _rows([("Order Summary", None), ("Filet-O-Fish", 1), ("Apple Pie", 1)])
+    items = parse_items(rows, find_sections(rows), PRICED)
+    assert [i["price"] for i in items] == [18.5, 0.0]
+    assert validate_totals(items, 30.0, 30.0) == []
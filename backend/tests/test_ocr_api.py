@@ -0,0 +1,39 @@
+import io
+
+import pytest
+
+from conftest import REPO_DIR
+
+pytest.importorskip("rapidocr_onnxruntime")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from app.main import app  # noqa: E402
+
+# testrun.JPG (1179 x 2556) captured as three overlapping scrolled screenshots
+SPLITS = [(0, 1600), (500, 2100), (956, 2556)]
+
+
+def _screenshots() -> list[bytes]:
+    image = Image.open(REPO_DIR / "testrun.JPG").convert("RGB")
+    shots = []
+    for top, bottom in SPLITS:
+        buf = io.BytesIO()
+        image.crop((0, top, image.width, bottom)).save(buf, format="PNG")
+        shots.append(buf.getvalue())
+    return shots
+
+
+def test_overlapping_screenshots_parse_as_one_receipt():
+    files = [("files", (f"part{i}.png", shot, "image/png")) for i, shot in enumerate(_screenshots())]
+    response = TestClient(app).post("/api/ocr", files=files)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["order_number"] == "206"
+    assert body["subtotal"] == 43.0
+    # The last screenshot is cropped down to the Total row alone
+    assert body["total"] == 43.0
+    assert body["errors"] == []
+    assert body["raw_text"].count("Order Summary") == 1
@@ -0,0 +1,43 @@
+from app.services.receipt_parser import cluster_rows, merge_screenshots, row_text
+
+ROW_HEIGHT = 60
+
+
+def _screenshot(lines: list[str]) -> list[dict]:
+    """Parser entries for one screenshot, one left-aligned box per line."""
+    return [{"text": text, "x": 100.0, "y": 50.0 + i * ROW_HEIGHT, "h": 30.0} for i, text in enumerate(lines)]
+
+
+def _merged_lines(*screenshots: list[str]) -> list[str]:
+    return [row_text(r) for r in cluster_rows(merge_screenshots([_screenshot(s) for s in screenshots]))]
+
+
+def test_exact_overlap_listed_once():
+    first = ["Order Summary", "Big Mac Meal 1", "Fries (M)", "Coca-Cola (M)"]
+    second = ["Fries (M)", "Coca-Cola (M)", "Payment Details", "Subtotal HK$ 43.00"]
+    assert _merged_lines(first, second) == [*first, "Payment Details", "Subtotal HK$ 43.00"]
+
+
+def test_noisy_overlap_listed_once():
+    first = ["Order Summary", "Chicken McNuggets (6pcs) 1", "Coca-Cola No Sugar (M)"]
+    second = ["Chicken McNuqgets (6pcs) 1", "Coca-Cola No Suqar (M)", "Payment Details"]
+    assert _merged_lines(first, second) == [*first, "Payment Details"]
+
+
+def test_total_not_merged_into_subtotal():
+    first = ["Payment Details", "Subtotal HK$ 43.00"]
+    second = ["Total HK$ 43.00", "Thank you"]
+    assert _merged_lines(first, second) == [*first, *second]
+
+
+def test_rows_with_other_digits_not_merged():
+    first = ["Order Summary", "Chicken McNuggets (6pcs) 1", "Subtotal HK$ 43.00"]
+    second = ["Chicken McNuggets (9pcs) 1", "Subtotal HK$ 48.00"]
+    assert _merged_lines(first, second) == [*first, *second]
+
+
+def test_aligned_screenshot_appended_as_is():
+    first = ["Order Summary", "Fries (M) 1"]
+    second = ["Fries (M) 1"]
+    entries = merge_screenshots([_screenshot(first), _screenshot(second)], aligned=[False, True])
+    assert [row_text(r) for r in cluster_rows(entries)] == [*first, *second]
@@ -30,9 +30,9 @@ def test_image(path: str, label: str) -> None:
         image_bytes = f.read()
 
     print("\n--- Running OCR with Metadata ---")
-    ocr_data = extract_text_with_metadata(image_bytes)
-    ocr_results = ocr_data['ocr_results']
-    
+    ocr_result = extract_text_with_metadata(image_bytes)
+    ocr_results = ocr_result.to_dicts()
+
     print(f"Found {len(ocr_results)} text boxes.")
     for i, res in enumerate(ocr_results[:10]):
         print(f"  [{i}] {res['text']} (x={res['avg_x']:.1f}, y={res['avg_y']:.1f})")
@@ -40,8 +40,8 @@ def test_image(path: str, label: str) -> None:
         print(f"  ... and {len(ocr_results) - 10} more.")
 
     print("\n--- Parsed Result ---")
-    # parse_mcd_app_receipt expects a list of lists of OCR results
-    result = parse_mcd_app_receipt([ocr_results])
+    # parse_mcd_app_receipt expects one OCRResult per screenshot
+    result = parse_mcd_app_receipt([ocr_result])
     print(json.dumps(result, indent=2, ensure_ascii=False))
 
     print(f"\n--- Validation ---")